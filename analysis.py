@@ -1,8 +1,12 @@
 from scipy import stats
+import numpy as np
 import pandas as pd
+import instrument
 import slicer
+from outcomes import OutcomeMatrix
 
-def confidence_interval(df: pd.DataFrame, success: str | list, confidence: float = 0.95) -> None:
+@instrument.instrumented()
+def confidence_interval(df: pd.DataFrame, success: str | list, confidence: float = 0.95) -> tuple:
     """
     Determine the chance of success of a certain breeding result, including confidence intervals.
 
@@ -10,7 +14,7 @@ def confidence_interval(df: pd.DataFrame, success: str | list, confidence: float
     ----------
     df: pd.DataFrame
         Dataset with which to determine success.
-    
+
     success: str | list
         List of monsters that are considered to be a successful result.
         If string, interpreted as a monster group alias.
@@ -20,13 +24,207 @@ def confidence_interval(df: pd.DataFrame, success: str | list, confidence: float
     """
     if type(success) is str:
         success = slicer.alias_parser(success)
-    k = 0
     # Count number of successes
-    for _, row in df.iterrows():
-        if row["Result Monster"] in success:
-            k+=1
+    k = int(df["Result Monster"].isin(success).sum())
     n = df.shape[0] # number of measurements
     print("{} datapoints have {} successes in total".format(n, k))
     interval = stats.beta.interval(confidence, k+1, n-k+1)
     print("That's a {}% confidence interval of between {:.4f} and {:.4f}".format(int(confidence*100), interval[0], interval[1]))
-    return interval
\ No newline at end of file
+    instrument.annotate(successes=k, trials=n, lower=float(interval[0]), upper=float(interval[1]))
+    return interval
+
+def target_label(target: str | list) -> str:
+    """
+    Readable name of a target: the alias itself, or the monsters separated by commas.
+    """
+    if type(target) is str:
+        return target
+    return ", ".join(target)
+
+def confidence_intervals(
+        df: pd.DataFrame,
+        targets: list,
+        by: list | None = None,
+        confidence: float = 0.95,
+        possible_only: bool = True,
+        outcomes: OutcomeMatrix | None = None,
+        ) -> pd.DataFrame:
+    """
+    Determine the chance of success with confidence intervals for many targets
+    and groups of breeding attempts at once. Uses the same interval as confidence_interval,
+    but doesn't print anything.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Dataset with which to determine success.
+
+    targets: list
+        Every target is a list of monsters that are considered a successful result,
+        or a string, interpreted as a monster group alias.
+
+    by: list | None, default None
+        Columns to group the attempts by, e.g. ["Torches Lit", "Island"].
+        If None, all attempts are pooled.
+
+    confidence: float, default 0.95
+        confidence% interval to give.
+
+    possible_only: bool, default True
+        Only count attempts that could have resulted in the target as trials,
+        like look_for_outcome_group does. Needs outcomes or a column "Possible results",
+        raises ValueError if there's neither. Set to False to count every attempt as a trial.
+
+    outcomes: OutcomeMatrix | None, default None
+        Possible results as a matrix (see breeder.possible_results_matrix), lined up with df.
+        If given, it's used instead of the "Possible results" column.
+
+    Returns
+    -------
+    intervals: pd.DataFrame
+        One row per target and group with at least one trial. Columns are "target",
+        the grouping columns, "k" (successes), "n" (trials), "lower" and "upper".
+    """
+    by = list(by) if by else []
+    if by:
+        grouped = df.groupby(by, sort=True, dropna=False, observed=True)
+        codes = grouped.ngroup().to_numpy()
+        groups = grouped.size().index.to_frame(index=False)
+    else:
+        codes = np.zeros(df.shape[0], dtype=np.int64)
+        groups = pd.DataFrame(index=[0])
+    n_groups = groups.shape[0]
+    if outcomes is not None and not outcomes.index.equals(df.index):
+        raise ValueError("Outcome matrix doesn't line up with the dataframe")
+    if possible_only and outcomes is None and "Possible results" not in df.columns:
+        raise ValueError("possible_only needs outcomes or a 'Possible results' column, see breeder.add_possible_results_to_df")
+    if possible_only and outcomes is None: # Go through the lists once, not again for every target
+        outcomes = OutcomeMatrix.from_results(df["Possible results"])
+
+    tables = []
+    for target in targets:
+        monsters = slicer.alias_parser(target) if type(target) is str else target
+        success = df["Result Monster"].isin(monsters).to_numpy()
+        if possible_only:
+            trial = outcomes.mask(monsters)
+        else:
+            trial = np.ones(df.shape[0], dtype=bool)
+        table = groups.copy()
+        table.insert(0, "target", target_label(target))
+        table["k"] = np.bincount(codes[trial & success], minlength=n_groups)
+        table["n"] = np.bincount(codes[trial], minlength=n_groups)
+        tables.append(table[table["n"] > 0])
+
+    intervals = pd.concat(tables, ignore_index=True)
+    k = intervals["k"].to_numpy()
+    n = intervals["n"].to_numpy()
+    intervals["lower"], intervals["upper"] = stats.beta.interval(confidence, k+1, n-k+1)
+    return intervals
+
+def contingency_cube(
+        df: pd.DataFrame,
+        target: str | list,
+        factors: list,
+        confidence: float = 0.95,
+        possible_only: bool = True,
+        outcomes: OutcomeMatrix | None = None,
+        ) -> pd.DataFrame:
+    """
+    Successes and trials for every combination of factors, e.g.
+    ["Torches Lit", "Parent 1 Level", "Island", "Day? (Local, 6am-8pm)"], in one grouped pass.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Dataset with which to determine success.
+
+    target: str | list
+        Monsters that are considered a successful result. If string, interpreted as a monster group alias.
+
+    factors: list
+        Columns to split the attempts by.
+
+    confidence, possible_only, outcomes:
+        See confidence_intervals.
+
+    Returns
+    -------
+    cube: pd.DataFrame
+        One row per combination of factors with at least one trial. Columns are the factors,
+        "k" (successes), "n" (trials), "rate" (k/n), "lower" and "upper".
+    """
+    cube = confidence_intervals(df, [target], by=factors, confidence=confidence, possible_only=possible_only, outcomes=outcomes)
+    cube = cube.drop(columns="target")
+    cube.insert(len(factors) + 2, "rate", cube["k"] / cube["n"])
+    return cube
+
+def homogeneity_tests(cube: pd.DataFrame, factor: str, within: list | None = None) -> pd.DataFrame:
+    """
+    Test if the chance of success differs between the values of a factor,
+    with a chi-square test (and Fisher's exact test if the factor only has two values).
+
+    Parameters
+    ----------
+    cube: pd.DataFrame
+        Output of contingency_cube.
+
+    factor: str
+        Factor to test, e.g. "Torches Lit".
+
+    within: list | None, default None
+        Other factors to hold constant: one test is done for every combination of them.
+        Factors of the cube that aren't in within (or factor) are pooled.
+        If None, everything else is pooled into a single test.
+
+    Returns
+    -------
+    tests: pd.DataFrame
+        One row per combination of the within factors. Columns are the within factors,
+        "values" (amount of values of factor with trials), "k", "n", "chi2", "dof",
+        "p_chi2", "p_fisher" (NaN unless there are exactly two values) and "min_expected"
+        (the chi-square test isn't reliable if this is below 5).
+    """
+    within = list(within) if within else []
+    cells = cube.groupby(within + [factor], sort=True, dropna=False, observed=True)[["k", "n"]].sum().reset_index()
+    cells = cells[cells["n"] > 0]
+    if within:
+        strata = cells.groupby(within, sort=True, dropna=False, observed=True)
+        codes = strata.ngroup().to_numpy()
+        tests = strata.size().index.to_frame(index=False)
+    else:
+        codes = np.zeros(cells.shape[0], dtype=np.int64)
+        tests = pd.DataFrame(index=[0])
+    n_strata = tests.shape[0]
+
+    # Chi-square test of the (values of factor) x (success, failure) table of every stratum at once
+    k = cells["k"].to_numpy(dtype=float)
+    n = cells["n"].to_numpy(dtype=float)
+    total_k = np.bincount(codes, weights=k, minlength=n_strata)
+    total_n = np.bincount(codes, weights=n, minlength=n_strata)
+    rate = total_k / total_n
+    expected_success = n * rate[codes]
+    expected_failure = n - expected_success
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(expected_success > 0, (k - expected_success) ** 2 / expected_success, 0)
+        terms += np.where(expected_failure > 0, (n - k - expected_failure) ** 2 / expected_failure, 0)
+    values = np.bincount(codes, minlength=n_strata)
+    chi2 = np.bincount(codes, weights=terms, minlength=n_strata)
+    dof = values - 1
+    min_expected = np.full(n_strata, np.inf)
+    np.minimum.at(min_expected, codes, np.minimum(expected_success, expected_failure))
+
+    tests["values"] = values
+    tests["k"] = total_k.astype(np.int64)
+    tests["n"] = total_n.astype(np.int64)
+    tests["chi2"] = chi2
+    tests["dof"] = dof
+    # Every attempt a success (or none): nothing differs
+    tests["p_chi2"] = np.where((dof > 0) & (rate > 0) & (rate < 1), stats.chi2.sf(chi2, np.maximum(dof, 1)), 1.0)
+    tests.loc[dof == 0, "p_chi2"] = np.nan
+    p_fisher = np.full(n_strata, np.nan)
+    for stratum in np.flatnonzero(values == 2):
+        (k1, k2), (n1, n2) = k[codes == stratum], n[codes == stratum]
+        p_fisher[stratum] = stats.fisher_exact([[k1, n1 - k1], [k2, n2 - k2]])[1]
+    tests["p_fisher"] = p_fisher
+    tests["min_expected"] = min_expected
+    return tests
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+import breeder
+import filereader
+import instrument
+import outcometable
+import resultcache
+from outcomes import OutcomeMatrix
+# Checking the whole sheet for results that the rules say are impossible,
+# which are either data entry errors or gaps in the rule files.
+
+AUDIT_STATE_FILE = "audit_state.json"
+
+# Causes of an impossible result, see failure_cause
+UNKNOWN_RESULT = "Unknown result monster"
+MISSING_ELEMENTS = "Missing element entry"
+MISSING_SPECIAL = "Missing special combination"
+MISSING_RARE = "Missing rare entry"
+PAIRO_FORM = "Wrong paironormal form for day/night"
+AVAILABILITY_WINDOW = "Outside availability window"
+
+def failure_cause(parent1: str, parent2: str, island: str, result: str, date, day: bool, night: bool) -> str:
+    """
+    Why a result is impossible for a breeding attempt, following the steps of breeder.attempt_results.
+    Only meaningful for results that aren't in the possible results.
+
+    Returns
+    -------
+    cause: str
+        One of
+        "Unknown result monster": the result isn't a monster in any rule file (typo?),
+        "Missing element entry": one of the parents has no elements and no special combination,
+        "Missing special combination": the parents can't give the result on this island,
+        "Missing rare entry": the parents can give the common version, but the rare isn't in existing_rares,
+        "Wrong paironormal form for day/night": the attempt wasn't at day on a normal or at night on a mirror island,
+        "Outside availability window": the result can be bred, but isn't always available on the island
+        and there's no event for it on the date.
+    """
+    common1, common2 = breeder.derare(parent1), breeder.derare(parent2)
+    outcomes = breeder.outcome_table.lookup(common1, common2, island)
+    if result not in outcomes:
+        if result not in breeder.compiled_rules().vocabulary.ids:
+            return UNKNOWN_RESULT
+        if (common1, common2) not in filereader.rules.specials and (
+                common1 not in filereader.rules.elements or common2 not in filereader.rules.elements):
+            return MISSING_ELEMENTS
+        if breeder.derare(result) != result and breeder.derare(result) in outcomes:
+            return MISSING_RARE
+        return MISSING_SPECIAL
+    if result in filereader.get_group("Paironormals"):
+        return PAIRO_FORM
+    return AVAILABILITY_WINDOW
+
+def impossible_mask(df: pd.DataFrame, outcomes: OutcomeMatrix) -> np.ndarray:
+    """
+    Boolean array, True for the rows whose "Result Monster" isn't one of their possible results.
+    """
+    result_ids = pd.Series(df["Result Monster"].to_numpy(dtype=object)).map(outcomes.vocabulary.ids)
+    known = result_ids.notna().to_numpy()
+    possible = np.zeros(len(df), dtype=bool)
+    rows = np.flatnonzero(known)
+    matrix = outcomes._aligned()
+    possible[rows] = np.asarray(matrix[rows, result_ids.to_numpy()[known].astype(np.int64)]).ravel()
+    return ~possible
+
+@instrument.instrumented()
+def audit(df: pd.DataFrame, outcomes: OutcomeMatrix | None = None, workers: int | None = None,
+          cache: resultcache.ResultCache | None = None) -> pd.DataFrame:
+    """
+    Find all breeding attempts with a result that the rules say is impossible, with the cause.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Breeding data from filereader.read_data.
+
+    outcomes: OutcomeMatrix | None, default None
+        Possible results of df (see breeder.possible_results_matrix). If None, they're taken
+        from the "Possible results" column, or computed if there's none.
+
+    workers, cache:
+        Used when computing the possible results, see breeder.unique_attempt_results.
+
+    Returns
+    -------
+    report: pd.DataFrame
+        One row per impossible attempt: "Sheet row" (the index if df doesn't have it),
+        the parents, island, date, day and night, "Result Monster", "Cause" and "Possible results".
+    """
+    outcomes = breeder.outcomes_for(df, outcomes, workers, cache)
+    impossible = impossible_mask(df, outcomes)
+    failures = df[impossible]
+    keys = breeder.attempt_keys(failures)
+    keys["result"] = failures["Result Monster"].to_numpy(dtype=object)
+
+    # Rows with the same attempt and result fail for the same reason, so every cause is only determined once
+    codes = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    unique = keys.iloc[first_rows]
+    causes = np.array([
+        failure_cause(parent1, parent2, island, result, date.date(), day, night)
+        for parent1, parent2, island, date, day, night, result in zip(
+            unique["parent1"].tolist(), unique["parent2"].tolist(), unique["island"].tolist(),
+            unique["date"].tolist(), unique["day"].tolist(), unique["night"].tolist(), unique["result"].tolist())
+    ], dtype=object)
+
+    if filereader.SHEET_ROW_COLUMN in df.columns:
+        sheet_rows = failures[filereader.SHEET_ROW_COLUMN].to_numpy()
+    else:
+        sheet_rows = failures.index.to_numpy()
+    return pd.DataFrame({
+        filereader.SHEET_ROW_COLUMN: sheet_rows,
+        "Parent 1 Species": keys["parent1"].to_numpy(),
+        "Parent 2 Species": keys["parent2"].to_numpy(),
+        "Island": keys["island"].to_numpy(),
+        "Date": keys["date"].to_numpy(),
+        "Day": keys["day"].to_numpy(),
+        "Night": keys["night"].to_numpy(),
+        "Result Monster": keys["result"].to_numpy(),
+        "Cause": causes[codes] if len(codes) else np.array([], dtype=object),
+        "Possible results": outcomes.subset(impossible).to_lists(),
+    })
+
+def summarize(report: pd.DataFrame) -> pd.DataFrame:
+    """
+    Amount of impossible attempts per cause, with the amount of distinct
+    (parents, island, result) combinations behind them. Most attempts first.
+    """
+    combinations = report[["Cause", "Parent 1 Species", "Parent 2 Species", "Island", "Result Monster"]].drop_duplicates()
+    summary = pd.DataFrame({
+        "Attempts": report["Cause"].value_counts(),
+        "Combinations": combinations["Cause"].value_counts(),
+    })
+    summary.index.name = "Cause"
+    return summary.sort_values("Attempts", ascending=False, kind="stable").reset_index()
+
+def report_dict(report: pd.DataFrame, checked: int) -> dict:
+    """
+    The report as plain data, e.g. for writing to JSON:
+    the amount of checked attempts, the summary per cause, and the impossible attempts per cause.
+    """
+    rows = report.copy()
+    rows["Date"] = rows["Date"].dt.strftime("%Y-%m-%d")
+    return {
+        "checked": int(checked),
+        "impossible": int(report.shape[0]),
+        "summary": summarize(report).to_dict(orient="records"),
+        "failures": {
+            cause: group.drop(columns="Cause").to_dict(orient="records")
+            for cause, group in rows.groupby("Cause", sort=True)
+        },
+    }
+
+def write_report(report: pd.DataFrame, path: str, checked: int) -> None:
+    """
+    Write the report to a .json (see report_dict) or .csv (one line per impossible attempt) file.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(report_dict(report, checked), f, indent=2, default=lambda value: value.item())
+    elif path.lower().endswith(".csv"):
+        report.to_csv(path, index=False)
+    else:
+        raise ValueError("Unknown file type for {}, use .json or .csv".format(path))
+
+def print_report(report: pd.DataFrame, checked: int) -> None:
+    print("{} of {} attempts have an impossible result".format(report.shape[0], checked))
+    if report.shape[0] == 0:
+        return
+    print(summarize(report).to_string(index=False))
+    for cause, group in report.groupby("Cause", sort=True):
+        print()
+        print(cause)
+        print(group[[filereader.SHEET_ROW_COLUMN, "Parent 1 Species", "Parent 2 Species", "Island", "Result Monster"]].to_string(index=False))
+
+def load_state(path: str = AUDIT_STATE_FILE) -> dict | None:
+    """
+    Where the last incremental audit stopped, or None if there's no (usable) state.
+    The state is thrown away when any of the rule files changed, because that can
+    change which old rows are impossible.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("hash") != outcometable.source_hash(resultcache.SOURCE_FILES):
+        return None
+    return state
+
+def save_state(last_sheet_row: int, path: str = AUDIT_STATE_FILE) -> None:
+    with open(path, "w") as f:
+        json.dump({"hash": outcometable.source_hash(resultcache.SOURCE_FILES), "last_sheet_row": int(last_sheet_row)}, f)
+
+def audit_new_rows(df: pd.DataFrame, state_path: str = AUDIT_STATE_FILE, workers: int | None = None,
+                   cache: resultcache.ResultCache | None = None) -> tuple:
+    """
+    Audit only the rows that were added to the sheet since the last call, see audit.
+    Rows are recognized by their "Sheet row", so df has to come from filereader.read_data.
+    Everything gets audited again when the rule files changed.
+
+    Returns
+    -------
+    report: pd.DataFrame
+        Impossible attempts among the new rows.
+
+    checked: int
+        Amount of new rows.
+    """
+    if filereader.SHEET_ROW_COLUMN not in df.columns:
+        raise ValueError("Incremental audits need the '{}' column from filereader.read_data".format(filereader.SHEET_ROW_COLUMN))
+    state = load_state(state_path)
+    sheet_rows = df[filereader.SHEET_ROW_COLUMN].to_numpy()
+    new = df if state is None else df[sheet_rows > state["last_sheet_row"]]
+    report = audit(new, workers=workers, cache=cache)
+    if len(sheet_rows) > 0:
+        previous = -1 if state is None else state["last_sheet_row"]
+        save_state(max(previous, int(sheet_rows.max())), state_path)
+    return report, new.shape[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find breeding attempts with results that the rules say are impossible.")
+    parser.add_argument("--new", action="store_true",
+                        help="Only check rows that were added since the last --new run")
+    parser.add_argument("--state", default=AUDIT_STATE_FILE,
+                        help="Where --new keeps track of the checked rows")
+    parser.add_argument("--report", default=None,
+                        help="Also write the report to this .json or .csv file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes to compute the possible results with")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse possible results from earlier runs (see resultcache.py)")
+    args = parser.parse_args()
+
+    df = filereader.read_data()
+    cache = resultcache.ResultCache() if args.cache else None
+    if args.new:
+        report, checked = audit_new_rows(df, args.state, args.workers, cache)
+    else:
+        report, checked = audit(df, workers=args.workers, cache=cache), df.shape[0]
+    print_report(report, checked)
+    if args.report is not None:
+        write_report(report, args.report, checked)
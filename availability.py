@@ -0,0 +1,146 @@
+import bisect
+import datetime
+import numpy as np
+import pandas as pd
+# Limited-time availability of monsters, stored as date intervals instead of per day.
+
+
+def _as_date(date) -> datetime.date:
+    if isinstance(date, datetime.datetime): # Also catches pd.Timestamp
+        return date.date()
+    return date
+
+def _is_missing(date) -> bool:
+    # NaT, NaN or None: never available (a missing date isn't in any event)
+    return date is None or bool(pd.isna(date))
+
+def _as_days(dates) -> np.ndarray:
+    return pd.DatetimeIndex(pd.to_datetime(dates)).values.astype("datetime64[D]")
+
+class AvailabilityIndex:
+    """
+    Index of which monsters are available to breed on which dates.
+    Every interval includes its start date and excludes its stop date.
+
+    Parameters
+    ----------
+    starts, stops: list
+        Start and stop dates (datetime.date) of every event.
+
+    monster_lists: list
+        For every event, a list of monsters that are available.
+    """
+    def __init__(self, starts: list, stops: list, monster_lists: list):
+        spans = {}
+        for start, stop, monsters in zip(starts, stops, monster_lists):
+            start, stop = _as_date(start), _as_date(stop)
+            if stop <= start: # Event without any days
+                continue
+            for monster in monsters:
+                spans.setdefault(monster, []).append((start, stop))
+
+        # Per monster: sorted intervals, overlapping ones merged together
+        self._starts = {}
+        self._stops = {}
+        for monster, intervals in spans.items():
+            intervals.sort()
+            merged = [list(intervals[0])]
+            for start, stop in intervals[1:]:
+                if start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], stop)
+                else:
+                    merged.append([start, stop])
+            self._starts[monster] = [start for start, _ in merged]
+            self._stops[monster] = [stop for _, stop in merged]
+
+        # Over all monsters: segment i runs from breakpoint i up to breakpoint i+1,
+        # and has the same available monsters on every day
+        changes = {}
+        for monster in self._starts:
+            for start, stop in zip(self._starts[monster], self._stops[monster]):
+                changes.setdefault(start, []).append((monster, True))
+                changes.setdefault(stop, []).append((monster, False))
+        self._breakpoints = sorted(changes)
+        self._segments = []
+        active = set()
+        for breakpoint in self._breakpoints:
+            for monster, starting in changes[breakpoint]:
+                if starting:
+                    active.add(monster)
+                else:
+                    active.discard(monster)
+            self._segments.append(frozenset(active))
+        self._breakpoint_days = _as_days(self._breakpoints)
+
+    def is_available(self, monster: str, date) -> bool:
+        """
+        Check if a monster is available through an event on a date.
+        """
+        starts = self._starts.get(monster)
+        if starts is None or _is_missing(date):
+            return False
+        date = _as_date(date)
+        i = bisect.bisect_right(starts, date) - 1
+        return i >= 0 and date < self._stops[monster][i]
+
+    def windows(self, monster: str) -> list:
+        """
+        Get all (start, stop) intervals in which a monster is available through an event.
+        """
+        return list(zip(self._starts.get(monster, []), self._stops.get(monster, [])))
+
+    def available_on(self, date) -> frozenset:
+        """
+        Get all monsters available through an event on a date.
+        """
+        if _is_missing(date):
+            return frozenset()
+        i = bisect.bisect_right(self._breakpoints, _as_date(date)) - 1
+        if i < 0:
+            return frozenset()
+        return self._segments[i]
+
+    def available_mask(self, monster: str, dates) -> np.ndarray:
+        """
+        Check for a whole column of dates if a monster is available on them.
+
+        Parameters
+        ----------
+        monster: str
+            Monster to look for.
+
+        dates: array-like
+            Dates, anything pd.to_datetime understands.
+
+        Returns
+        -------
+        mask: np.ndarray
+            Boolean array, True where the monster is available.
+        """
+        days = _as_days(dates)
+        if monster not in self._starts:
+            return np.zeros(len(days), dtype=bool)
+        starts = _as_days(self._starts[monster])
+        stops = _as_days(self._stops[monster])
+        i = np.searchsorted(starts, days, side="right") - 1
+        return (i >= 0) & (days < stops[np.maximum(i, 0)]) & ~np.isnat(days)
+
+    def available_on_many(self, dates) -> list:
+        """
+        Get the available monsters for a whole column of dates at once.
+        Returns a list with a frozenset of monsters per date.
+        """
+        days = _as_days(dates)
+        i = np.searchsorted(self._breakpoint_days, days, side="right") - 1
+        i[np.isnat(days)] = -1 # NaT sorts after every date
+        empty = frozenset()
+        return [self._segments[j] if j >= 0 else empty for j in i]
+
+    def __contains__(self, date) -> bool:
+        return len(self.available_on(date)) > 0
+
+    def __getitem__(self, date) -> frozenset:
+        monsters = self.available_on(date)
+        if not monsters:
+            raise KeyError(date)
+        return monsters
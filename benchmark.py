@@ -0,0 +1,465 @@
+import argparse
+import cProfile
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import fetcher
+import sheetserver
+import filereader
+import breeder
+import outcometable
+import reference
+import schema
+import slicer
+import analysis
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+# Benchmarks for the slower parts of the pipeline.
+# Runs on synthetic breeding sheets built from the rule files, so no network is needed.
+
+BASE_ROWS = 5000 # Rough size of the master sheet, used if msm_data.csv isn't there
+PIPELINE_TARGET = ["Rare Maw", "Rare Drumpler", "Rare Fwog"] # Same as main.py
+
+def current_sheet_size() -> int:
+    """
+    Amount of rows in the last cleaned master sheet, or BASE_ROWS if it was never read.
+    """
+    if os.path.exists("msm_data.csv"):
+        return pd.read_csv("msm_data.csv", usecols=[0]).shape[0]
+    return BASE_ROWS
+
+def synthetic_sheet(n_rows: int, seed: int = 0, pool_size: int = 300) -> pd.DataFrame:
+    """
+    Build a fake cleaned breeding sheet with the same columns as filereader.read_data.
+    Attempts are drawn from a pool of popular (parent pair, island) combinations,
+    since people tend to breed the same combinations over and over.
+
+    Parameters
+    ----------
+    n_rows: int
+        Amount of breeding attempts.
+
+    seed: int, default 0
+        Seed for the random number generator.
+
+    pool_size: int, default 300
+        Amount of distinct (parent pair, island) combinations to draw from.
+    """
+    rng = np.random.default_rng(seed)
+    element_monsters = list(filereader.elements)
+    special_pairs = sorted({pair for pair in filereader.specials})
+    islands = list(filereader.always_available)
+    pool = []
+    i = 0
+    while len(pool) < pool_size:
+        i += 1
+        if i % 2 == 0:
+            parent1, parent2 = special_pairs[rng.integers(len(special_pairs))]
+        else:
+            parent1, parent2 = rng.choice(element_monsters, 2)
+        if rng.random() < 0.2 and parent1 in filereader.existing_rares:
+            parent1 = "Rare " + parent1
+        island = islands[rng.integers(len(islands))]
+        if rng.random() < 0.3:
+            island = "M " + island
+        try:
+            # All outcomes, not only the available ones, so rares and event monsters show up too
+            outcomes = breeder.breeding_outcomes(breeder.derare(parent1), breeder.derare(parent2), island)
+        except KeyError: # Element combination that doesn't exist, like a natural with an ethereal
+            continue
+        pool.append((parent1, parent2, island, outcomes))
+
+    # Popular combinations get bred more often
+    weights = 1 / np.arange(1, pool_size + 1)
+    picks = rng.choice(pool_size, size=n_rows, p=weights / weights.sum())
+    availabilities = pd.read_csv("availabilities.csv")
+    first_day = pd.to_datetime(availabilities["startdate"]).min()
+    last_day = pd.to_datetime(availabilities["stopdate"]).max()
+    n_days = (last_day - first_day).days
+    dates = first_day + pd.to_timedelta(rng.integers(0, n_days, size=n_rows), unit="D")
+    day = rng.random(n_rows) < 0.6
+    results = [pool[pick][3][rng.integers(len(pool[pick][3]))] for pick in picks]
+    return pd.DataFrame({
+        "Parent 1 Species": [pool[pick][0] for pick in picks],
+        "Parent 1 Level": rng.integers(4, 21, size=n_rows).astype(float),
+        "Parent 2 Species": [pool[pick][1] for pick in picks],
+        "Parent 2 Level": rng.integers(4, 21, size=n_rows).astype(float),
+        "Island": [pool[pick][2] for pick in picks],
+        "Date (MSM time) (MM/DD/YYYY)": dates,
+        "Day? (Local, 6am-8pm)": day,
+        "Night? (Local, 6am-8pm)": ~day,
+        "Torches Lit": rng.integers(0, 11, size=n_rows).astype(float),
+        "Result Monster": results,
+    })
+
+def raw_sheet(df: pd.DataFrame, invalid_fraction: float = 0.01, seed: int = 0) -> tuple:
+    """
+    Turn a synthetic cleaned sheet back into what fetching the Google sheets gives:
+    the master sheet with its second header row, and the validation sheet.
+    Some rows get an unknown result monster or an unreadable date, so cleaning has something to drop.
+
+    Returns
+    -------
+    raw: pd.DataFrame
+        Master sheet, as read with pd.read_csv(url, header=0).
+
+    validation: pd.DataFrame
+        Validation sheet, with the monster lists in its second and third column.
+    """
+    rng = np.random.default_rng(seed)
+    raw = pd.DataFrame({
+        "Parent 1": df["Parent 1 Species"],
+        "Unnamed: 1": df["Parent 1 Level"],
+        "Parent 2": df["Parent 2 Species"],
+        "Unnamed: 3": df["Parent 2 Level"],
+        "Island": df["Island"].replace("M Air", "M AIr"),
+        "Date (MSM time)\n(MM/DD/YYYY)": df["Date (MSM time) (MM/DD/YYYY)"].dt.strftime("%m/%d/%Y"),
+        "Time since reset": "1:00:00",
+        "Day? (Local, 6am-8pm)": np.where(df["Day? (Local, 6am-8pm)"], "TRUE", "FALSE"),
+        "Night? (Local, 6am-8pm)": np.where(df["Night? (Local, 6am-8pm)"], "TRUE", "FALSE"),
+        "Torches Lit": df["Torches Lit"].where(rng.random(df.shape[0]) > 0.1), # Sometimes left blank
+        "Result Monster": df["Result Monster"],
+    })
+    invalid = rng.random(df.shape[0]) < invalid_fraction
+    raw.loc[invalid & (rng.random(df.shape[0]) < 0.5), "Result Monster"] = "Not A Monster"
+    raw.loc[invalid & (raw["Result Monster"] != "Not A Monster"), "Date (MSM time)\n(MM/DD/YYYY)"] = "??"
+    header = pd.DataFrame([{"Parent 1": "Species", "Unnamed: 1": "Level", "Parent 2": "Species", "Unnamed: 3": "Level"}])
+    raw = pd.concat([header, raw], ignore_index=True)
+
+    parents = sorted(set(df["Parent 1 Species"]) | set(df["Parent 2 Species"]))
+    results = sorted(set(df["Result Monster"]))
+    length = max(len(parents), len(results))
+    validation = pd.DataFrame({
+        "Monster": range(length),
+        "Monsters that breed": parents + [None] * (length - len(parents)),
+        "Monsters that are bred": results + [None] * (length - len(results)),
+    })
+    return raw, validation
+
+def reference_possible_results(df: pd.DataFrame) -> list:
+    # The original row-by-row implementation of add_possible_results_to_df, on the original rules (reference.py)
+    results_list = []
+    for _, row in df.iterrows():
+        results_list.append(reference.attempt_results(
+            row["Parent 1 Species"],
+            row["Parent 2 Species"],
+            row["Island"],
+            row["Date (MSM time) (MM/DD/YYYY)"].date(),
+            row["Day? (Local, 6am-8pm)"],
+            row["Night? (Local, 6am-8pm)"],
+        ))
+    return results_list
+
+def timed(function, *args):
+    start = time.perf_counter()
+    output = function(*args)
+    return output, time.perf_counter() - start
+
+def bench_possible_results(scales: list, reference: bool = True) -> None:
+    base = current_sheet_size()
+    print("Base sheet size: {} rows".format(base))
+    for scale in scales:
+        df = synthetic_sheet(base * scale)
+        batch, batch_time = timed(breeder.possible_results_batch, df)
+        line = "{:>4}x ({:>7} rows): batch {:8.3f}s".format(scale, df.shape[0], batch_time)
+        if reference:
+            expected, reference_time = timed(reference_possible_results, df)
+            assert batch == expected, "Batch results differ from the row-by-row results"
+            line += ", row-by-row {:8.3f}s, speedup {:6.1f}x".format(reference_time, reference_time / batch_time)
+        print(line)
+
+def list_column_bytes(column: pd.Series) -> int:
+    # The lists themselves, not the monster names (those are shared between rows)
+    return int(column.memory_usage(deep=False) + column.map(sys.getsizeof).sum())
+
+def bench_outcome_matrix(scales: list, target: str = "Rare Naturals") -> None:
+    base = current_sheet_size()
+    for scale in scales:
+        df = synthetic_sheet(base * scale)
+        breeder.add_possible_results_to_df(df)
+        outcomes, matrix_time = timed(breeder.possible_results_matrix, df)
+        _, list_query_time = timed(slicer.look_for_outcome_group, df, target)
+        _, matrix_query_time = timed(slicer.look_for_outcome_group, df, target, False, outcomes)
+        print("{:>4}x ({:>7} rows): lists {:6.1f} MB, matrix {:6.1f} MB (built in {:.3f}s), "
+              "'{}' query {:.4f}s on lists, {:.4f}s on matrix".format(
+                  scale, df.shape[0], list_column_bytes(df["Possible results"]) / 1e6, outcomes.nbytes / 1e6,
+                  matrix_time, target, list_query_time, matrix_query_time))
+
+def bench_parallel(scales: list, max_workers: int | None = None) -> None:
+    base = current_sheet_size()
+    max_workers = max_workers or os.cpu_count() or 1
+    worker_counts = sorted({1, max_workers} | {2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers})
+    print("{} CPU cores available".format(os.cpu_count()))
+    for scale in scales:
+        df = synthetic_sheet(base * scale)
+        serial, serial_time = timed(breeder.possible_results_batch, df)
+        for workers in worker_counts:
+            parallel, parallel_time = timed(breeder.possible_results_batch, df, workers)
+            assert parallel == serial, "Parallel results differ from the serial results"
+            print("{:>4}x ({:>7} rows), {:>2} workers: {:8.3f}s, speedup {:5.2f}x".format(
+                scale, df.shape[0], workers, parallel_time, serial_time / parallel_time))
+
+def schema_operations(df: pd.DataFrame) -> None:
+    # The kind of filtering slicer does on the cleaned data
+    naturals = filereader.get_group("Naturals")
+    df["Parent 1 Species"].isin(naturals) & df["Parent 2 Species"].isin(naturals)
+    df[df["Result Monster"] == "Rare Maw"]
+    df["Island"].value_counts()
+    df["Torches Lit"].value_counts()
+    df[["Parent 1 Level", "Parent 2 Level"]].value_counts()
+    with contextlib.redirect_stdout(io.StringIO()):
+        slicer.constant_torches(df)
+
+def bench_schema(scales: list, repeats: int = 5) -> None:
+    base = current_sheet_size()
+    for scale in scales:
+        before = synthetic_sheet(base * scale)
+        after, convert_time = timed(schema.apply_schema, before)
+        before_time = min(timed(schema_operations, before)[1] for _ in range(repeats))
+        after_time = min(timed(schema_operations, after)[1] for _ in range(repeats))
+        print("{:>4}x ({:>7} rows): memory {:6.1f} MB -> {:5.1f} MB, filters {:.4f}s -> {:.4f}s "
+              "(converting took {:.3f}s)".format(
+                  scale, before.shape[0], before.memory_usage(deep=True).sum() / 1e6,
+                  after.memory_usage(deep=True).sum() / 1e6, before_time, after_time, convert_time))
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import numpy, pandas, scipy.stats, scipy.sparse
+dependencies = time.perf_counter()
+import filereader, breeder, slicer, analysis
+imported = time.perf_counter()
+filereader.rules.always_available, filereader.rules.specials, filereader.rules.existing_rares
+loaded = time.perf_counter()
+print(dependencies - start, imported - dependencies, loaded - imported)
+"""
+
+def bench_import(scales: list = None, repeats: int = 5) -> None:
+    # Every run needs a fresh interpreter, otherwise the modules are already imported
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True).stdout
+        timings.append([float(value) for value in output.split()])
+    dependencies, imported, loaded = np.median(timings, axis=0)
+    print("Median of {} runs: dependencies {:.3f}s, importing our modules {:.3f}s, "
+          "loading the rule data on first use {:.3f}s".format(repeats, dependencies, imported, loaded))
+
+def bench_compiled(scales: list, seed: int = 0) -> None:
+    compiled = breeder.compiled_rules()
+    parents = outcometable.table_parents()
+    _, table_time = timed(outcometable.build_table, breeder.breeding_outcomes, parents, breeder.outcome_islands)
+    print("Outcome table built in {:.3f}s".format(table_time))
+    rng = np.random.default_rng(seed)
+    base = current_sheet_size()
+    for scale in scales:
+        parents1 = compiled.ids(rng.choice(parents, base * scale))
+        parents2 = compiled.ids(rng.choice(parents, base * scale))
+        pairs = list(zip(parents1.tolist(), parents2.tolist()))
+        def one_by_one():
+            for parent1, parent2 in pairs:
+                try:
+                    compiled.basic_pair(parent1, parent2)
+                except KeyError:
+                    pass
+        _, single_time = timed(one_by_one)
+        _, many_time = timed(compiled.basic_many, parents1, parents2)
+        print("{:>4}x ({:>7} pairs): one pair at a time {:8.4f}s, all at once {:8.4f}s".format(
+            scale, len(pairs), single_time, many_time))
+
+def bench_fetch(scales: list, delay: float = 0.3) -> None:
+    # Against a local stand-in server that takes delay seconds to answer every request
+    base = current_sheet_size()
+    for scale in scales:
+        raw, validation = raw_sheet(synthetic_sheet(base * scale))
+        files = {"/sheet.csv": raw.to_csv(index=False), "/validation.csv": validation.to_csv(index=False)}
+        with sheetserver.local_server(files, delay=delay) as server, tempfile.TemporaryDirectory() as cache_dir:
+            urls = [server.url + path for path in files]
+            _, sequential_time = timed(lambda: [pd.read_csv(url, low_memory=False) for url in urls])
+            downloads = fetcher.Fetcher(cache_dir)
+            _, cold_time = timed(lambda: [pd.read_csv(path, low_memory=False) for path in downloads.download_all(urls).values()])
+            _, warm_time = timed(lambda: [pd.read_csv(path, low_memory=False) for path in downloads.download_all(urls).values()])
+            downloads.close()
+        print("{:>4}x ({:>7} rows): one after the other {:6.3f}s, at once {:6.3f}s, unchanged {:6.3f}s".format(
+            scale, raw.shape[0], sequential_time, cold_time, warm_time))
+
+def pipeline_stages(files: dict, target: list) -> list:
+    """
+    The steps of main.py as (name, function) pairs. Every function gets the output
+    of the previous one, the first one gets None.
+
+    Parameters
+    ----------
+    files: dict
+        Local file for filereader.SHEET_URL and filereader.VALIDATION_URL.
+
+    target: list
+        Monsters to analyse.
+    """
+    def fetch(url, **kwargs):
+        return pd.read_csv(files[url], **kwargs)
+    return [
+        ("read_data", lambda _: filereader.read_data(fetch=fetch)),
+        ("add_possible_results_to_df", breeder.add_possible_results_to_df),
+        ("look_for_outcome_group", lambda df: slicer.look_for_outcome_group(df, target)),
+        ("constant_torches", slicer.constant_torches),
+        ("confidence_interval", lambda subset: analysis.confidence_interval(subset, success=target)),
+    ]
+
+def peak_memory(function, *args) -> int:
+    # Peak of memory allocated by Python while running the function, in bytes
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def profile_stage(name: str, function, data, profile_dir: str, profiler: str = "cprofile") -> None:
+    """
+    Profile one stage, writing <name>.prof (cProfile) or <name>.html (pyinstrument) to profile_dir.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    if profiler == "pyinstrument":
+        if pyinstrument is None:
+            raise ImportError("pyinstrument isn't installed, use the cprofile profiler instead")
+        profile = pyinstrument.Profiler()
+        profile.start()
+        function(data)
+        profile.stop()
+        with open(os.path.join(profile_dir, name + ".html"), "w") as f:
+            f.write(profile.output_html())
+    else:
+        profile = cProfile.Profile()
+        profile.runcall(function, data)
+        profile.dump_stats(os.path.join(profile_dir, name + ".prof"))
+
+def run_pipeline(df: pd.DataFrame, target: list = PIPELINE_TARGET, profile_dir: str | None = None, profiler: str = "cprofile") -> list:
+    """
+    Run all stages of main.py on a synthetic sheet, from the raw Google sheets to the confidence interval.
+    Every stage is run once for its time, once more for its peak memory (tracing memory slows it down)
+    and once more if it gets profiled.
+
+    Returns
+    -------
+    stages: list
+        One dict per stage with its "stage" name, "seconds", "peak_mb", "rows_in" and "rows_out"
+        (None if the stage doesn't give a dataframe).
+    """
+    raw, validation = raw_sheet(df)
+    # Load everything that gets read from the working directory, before leaving it
+    for name in filereader.RuleData.TABLES:
+        getattr(filereader.rules, name)
+    breeder.outcome_table.table
+    breeder.compiled_rules()
+    if profile_dir is not None:
+        profile_dir = os.path.abspath(profile_dir)
+    stages = []
+    # read_data writes msm_data.csv, which shouldn't replace the real one
+    with tempfile.TemporaryDirectory() as directory, contextlib.chdir(directory):
+        raw.to_csv("sheet.csv", index=False)
+        validation.to_csv("validation.csv", index=False)
+        files = {filereader.SHEET_URL: "sheet.csv", filereader.VALIDATION_URL: "validation.csv"}
+        data = None
+        for name, function in pipeline_stages(files, target):
+            with contextlib.redirect_stdout(io.StringIO()):
+                peak = peak_memory(function, data)
+                if profile_dir is not None:
+                    profile_stage(name, function, data, profile_dir, profiler)
+                output, seconds = timed(function, data)
+            stages.append({
+                "stage": name,
+                "seconds": seconds,
+                "peak_mb": peak / 1e6,
+                "rows_in": raw.shape[0] if data is None else len(data),
+                "rows_out": len(output) if isinstance(output, pd.DataFrame) else None,
+            })
+            data = output
+    return stages
+
+def compare_reports(old: dict, new: dict) -> None:
+    """
+    Print the time and memory of every stage in a new pipeline report relative to an old one.
+    """
+    old_stages = {(run["rows"], stage["stage"]): stage for run in old["runs"] for stage in run["stages"]}
+    for run in new["runs"]:
+        for stage in run["stages"]:
+            before = old_stages.get((run["rows"], stage["stage"]))
+            if before is None:
+                continue
+            print("{:>7} rows, {:<27} time {:6.2f}x, peak memory {:6.2f}x".format(
+                run["rows"], stage["stage"], stage["seconds"] / before["seconds"], stage["peak_mb"] / max(before["peak_mb"], 1e-9)))
+
+def bench_pipeline(scales: list, report: str | None = None, profile_dir: str | None = None,
+                   profiler: str = "cprofile", compare: str | None = None) -> None:
+    base = current_sheet_size()
+    runs = []
+    for scale in scales:
+        df = synthetic_sheet(base * scale)
+        stages = run_pipeline(df, profile_dir=None if profile_dir is None else os.path.join(profile_dir, "{}x".format(scale)), profiler=profiler)
+        runs.append({"scale": scale, "rows": df.shape[0], "stages": stages})
+        for stage in stages:
+            print("{:>4}x ({:>7} rows) {:<27} {:8.3f}s, peak {:7.1f} MB, rows {:>7} -> {:>7}".format(
+                scale, df.shape[0], stage["stage"], stage["seconds"], stage["peak_mb"], stage["rows_in"], str(stage["rows_out"])))
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "target": PIPELINE_TARGET,
+        "runs": runs,
+    }
+    if compare is not None:
+        with open(compare) as f:
+            compare_reports(json.load(f), results)
+    if report is not None:
+        with open(report, "w") as f:
+            json.dump(results, f, indent=2)
+
+BENCHMARKS = {
+    "possible_results": bench_possible_results,
+    "outcome_matrix": bench_outcome_matrix,
+    "parallel": bench_parallel,
+    "import": bench_import,
+    "schema": bench_schema,
+    "compiled": bench_compiled,
+    "fetch": bench_fetch,
+    "pipeline": bench_pipeline,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the breeding analysis pipeline.")
+    parser.add_argument("benchmark", nargs="?", choices=list(BENCHMARKS), default="possible_results",
+                        help="What to benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100],
+                        help="Multiples of the current sheet size to benchmark")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Most worker processes to try in the parallel benchmark (default: all cores)")
+    parser.add_argument("--no-reference", action="store_true",
+                        help="Skip the (slow) row-by-row reference implementation")
+    parser.add_argument("--report", default=None,
+                        help="Write the pipeline timings to this JSON file")
+    parser.add_argument("--compare", default=None,
+                        help="Compare the pipeline timings to an earlier JSON report")
+    parser.add_argument("--profile", default=None,
+                        help="Profile every pipeline stage, writing the profiles to this directory")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="Profiler to use with --profile")
+    args = parser.parse_args()
+    if args.benchmark == "possible_results":
+        bench_possible_results(args.scales, reference=not args.no_reference)
+    elif args.benchmark == "parallel":
+        bench_parallel(args.scales, args.workers)
+    elif args.benchmark == "pipeline":
+        bench_pipeline(args.scales, args.report, args.profile, args.profiler, args.compare)
+    else:
+        BENCHMARKS[args.benchmark](args.scales)
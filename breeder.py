@@ -1,11 +1,17 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
 import filereader
+import instrument
+import outcometable
+from compiledrules import CompiledRules
+from outcomes import OutcomeMatrix
+from resultcache import ResultCache
+from reverseindex import ReverseIndex
+from vocabulary import MonsterVocabulary, build_vocabulary
 
-elements = filereader.elements
-reverse_elements = filereader.reverse_elements
-specials = filereader.specials
-always_available = filereader.always_available
-special_availabilities = filereader.special_availabilities
-existing_rares = filereader.existing_rares
+rules = filereader.rules
 
 ethereal_pairo={
     "Plant":"Ghazt",
@@ -20,22 +26,47 @@ ethereal_pairo={
 }
 
 natural_singles = ["Noggin", "Toe Jammer", "Mammott", "Potbelly", "Tweedle"]
-pairos = filereader.get_group("Paironormals")
 ethereal_elements = ["Pl", "Sh", "Me", "Cr", "Po"]
 
 def possible_results(datapoint): 
-    parent1 = derare(datapoint["Parent 1 Species"])
-    parent2 = derare(datapoint["Parent 2 Species"])
-    island = datapoint["Island"]
+    return attempt_results(
+        datapoint["Parent 1 Species"],
+        datapoint["Parent 2 Species"],
+        datapoint["Island"],
+        datapoint["Date (MSM time) (MM/DD/YYYY)"].date(),
+        datapoint["Day? (Local, 6am-8pm)"],
+        datapoint["Night? (Local, 6am-8pm)"],
+    )
+
+def attempt_results(parent1, parent2, island, date, day, night):
+    """
+    Determine all possible results of a single breeding attempt.
+
+    Parameters
+    ----------
+    parent1, parent2: str
+    Parent names, can be rare.
+
+    island: str
+    Island name, can be a mirror island.
+
+    date: datetime.date
+    Date of the attempt (MSM time).
+
+    day, night: bool
+    Whether the attempt was done during the day or during the night.
+    Only exactly True counts.
+
+    Returns
+    -------
+    available_results: list
+    All monsters that could have resulted from this attempt.
+    """
+    always_available = rules.always_available
+    special_availabilities = rules.special_availabilities
+    pairos = filereader.get_group("Paironormals")
     demirrored = demirror(island)
-    date = datapoint["Date (MSM time) (MM/DD/YYYY)"].date()
-    day = datapoint["Day? (Local, 6am-8pm)"]
-    night = datapoint["Night? (Local, 6am-8pm)"]
-
-    basic_results = basic_breeding(parent1, parent2)
-    special_results = special_breeding(parent1, parent2, demirrored)
-    total_results = basic_results + special_results
-    rareified_results = rareify(total_results, island == "Shugabush")
+    rareified_results = outcome_table.lookup(derare(parent1), derare(parent2), island)
     # Apply availability filter
     available_results = []
     for result in rareified_results:
@@ -46,9 +77,8 @@ def possible_results(datapoint):
                 available_results.append(result)
             elif island[0:2] != "M " and day is True: # Major form
                 available_results.append(result)
-        elif date in special_availabilities: # Event availabilities
-            if result in special_availabilities[date]:
-                available_results.append(result)
+        elif special_availabilities.is_available(result, date): # Event availabilities
+            available_results.append(result)
     return available_results
 
 def get_available(date):
@@ -76,7 +106,7 @@ def rareify(monsters, shugabush = False):
     Usually doesn't add the rare version of natural, fire or magical singles,
     except for when input parameter shugabush is set to True.
     """
-    extended_rares = existing_rares.copy()
+    extended_rares = rules.existing_rares.copy()
     if shugabush: # Only on Shugabush Island can getting a Mammott or Potbelly result in its rare form
         extended_rares = extended_rares + natural_singles
     new_monsters = []
@@ -93,42 +123,35 @@ def rareify(monsters, shugabush = False):
 
     return new_monsters
 
+_compiled = None
+
+def compiled_rules() -> CompiledRules:
+    """
+    The rule files compiled to integer lookup arrays, built on first use.
+    """
+    global _compiled
+    if _compiled is None:
+        _compiled = CompiledRules(rules.elements, rules.reverse_elements, rules.specials, build_vocabulary(),
+                                  rules.existing_rares, natural_singles, ethereal_elements)
+    return _compiled
+
+def _reset_compiled_rules() -> None:
+    global _compiled
+    _compiled = None
+
+rules.on_reload(_reset_compiled_rules)
+
 def basic_breeding(parent1, parent2):
     """
     'Regular' breeding mechanics involving elements.
     Uses the elements of the incoming monsters to determine the outcome.
+    Raises KeyError if the parents combine to elements without a monster.
     """
-    # See if both parents have registered elements
-    if parent1 in elements and parent2 in elements:
-        els1 = elements[parent1]
-        els2 = elements[parent2]
-        # Rare singles
-        if len(els1) == 3 and len(els2) == 3:
-            shared_elements = []
-            for element in els1:
-                if element in els2:
-                    shared_elements.append(element)
-            rare_singles = ["Rare "+reverse_elements[(element, )] for element in shared_elements]
-            return [parent1, parent2] + rare_singles
-        else:
-            # Check if no shared elements
-            for element in els1:
-                if element in els2:
-                    return [parent1, parent2]
-            for element in els2:
-                if element in els1:
-                    return [parent1, parent2]
-            
-            # Produce new results
-            if els1[0] in ethereal_elements: # Ethereal Island also doesn't breed anything over 2 elements
-                if len(els1 + els2) >= 3:
-                    return [parent1, parent2]
-            new_monster = reverse_elements[tuple(sorted(els1+els2))]
-            if parent1 in natural_singles and parent2 in natural_singles:
-                return [new_monster] # If parents are two natural singles: only return double
-            else:
-                return [parent1, parent2, new_monster]
-    return [parent1, parent2] # Fallback if parents don't have registered elements
+    compiled = compiled_rules()
+    ids = compiled.vocabulary.ids
+    if parent1 not in ids or parent2 not in ids: # Fallback if parents don't have registered elements
+        return [parent1, parent2]
+    return compiled.names(compiled.basic_pair(ids[parent1], ids[parent2]))
 
 def special_breeding(parent1, parent2, island):
     """
@@ -156,6 +179,8 @@ def special_breeding(parent1, parent2, island):
     List of probably but not certainly length 1 containing all special breeding results.
     Paironormals will not have a form assigned.
     """
+    specials = rules.specials
+    elements = rules.elements
     # Just get most of them out of the dict
     special_result = []
     if (parent1, parent2) in specials:
@@ -170,18 +195,210 @@ def special_breeding(parent1, parent2, island):
                 special_result = special_result + [eth]
     return special_result
 
-def add_possible_results_to_df(df):
-    results_list = []
-    for _, row in df.iterrows():
-        results = possible_results(row)
-        results_list.append(results)
-    df['Possible results'] = results_list
+def breeding_outcomes(parent1, parent2, island):
+    """
+    All outcomes of breeding two (common) parents on an island, including rares,
+    before checking if they are available.
+    Same as rareify(basic_breeding + special_breeding), but on the compiled rules.
+    """
+    compiled = compiled_rules()
+    id1 = compiled.monster_id(parent1)
+    id2 = compiled.monster_id(parent2)
+    outcomes = compiled.basic_pair(id1, id2) + compiled.special_pair(id1, id2)
+    # Ethereals + Paironormals get special treatment
+    demirrored = demirror(island)
+    if demirrored in ethereal_pairo and {compiled.element_count(id1), compiled.element_count(id2)} == {3, 4}:
+        outcomes = outcomes + (compiled.monster_id(ethereal_pairo[demirrored]), )
+    return compiled.names(compiled.rareify(outcomes, island == "Shugabush"))
+
+# Islands where the outcomes can differ from the outcomes on any other island
+outcome_islands = ["Shugabush"] + list(ethereal_pairo) + ["M " + island for island in ethereal_pairo]
+outcome_table = outcometable.OutcomeTable(breeding_outcomes, outcome_islands)
+rules.on_reload(outcome_table.reset)
+
+_reverse_index = None
+
+def reverse_index() -> ReverseIndex:
+    """
+    Index from result monster to the parent pairs, islands and dates that can give it,
+    built from the outcome table on first use.
+    """
+    global _reverse_index
+    if _reverse_index is None:
+        islands = list(rules.always_available)
+        _reverse_index = ReverseIndex(outcome_table.table, islands + ["M " + island for island in islands],
+                                      rules.always_available, rules.special_availabilities,
+                                      filereader.get_group("Paironormals"))
+    return _reverse_index
+
+def _reset_reverse_index() -> None:
+    global _reverse_index
+    _reverse_index = None
+
+rules.on_reload(_reset_reverse_index)
+
+def _is_true(column: pd.Series) -> np.ndarray:
+    # attempt_results checks "is True", so 1 or "TRUE" don't count as day/night
+    if column.dtype == bool:
+        return column.to_numpy()
+    return np.array([value is True for value in column], dtype=bool)
+
+def attempt_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Get the columns that determine the possible results of a breeding attempt.
+    Two rows with the same key always have the same possible results.
+    """
+    return pd.DataFrame({
+        "parent1": df["Parent 1 Species"].to_numpy(),
+        "parent2": df["Parent 2 Species"].to_numpy(),
+        "island": df["Island"].to_numpy(),
+        "date": df["Date (MSM time) (MM/DD/YYYY)"].dt.normalize().to_numpy(),
+        "day": _is_true(df["Day? (Local, 6am-8pm)"]),
+        "night": _is_true(df["Night? (Local, 6am-8pm)"]),
+    })
+
+def rule_tables() -> dict:
+    """
+    All rule data attempt_results needs, to hand to worker processes.
+    """
+    tables = {name: getattr(rules, name) for name in filereader.RuleData.TABLES}
+    return {"rules": tables, "outcome_table": outcome_table.table}
+
+def _init_worker(tables: dict) -> None:
+    # Use the rule tables of the main process instead of reading the files again
+    rules.update(tables["rules"])
+    outcome_table._table = tables["outcome_table"]
+
+def _attempt_results_chunk(keys: list) -> list:
+    return [attempt_results(*key) for key in keys]
+
+def unique_attempt_results(df: pd.DataFrame, workers: int | None = None, cache: ResultCache | None = None) -> tuple:
+    """
+    Determine the possible results of every distinct breeding attempt in a dataframe.
+    Rows are grouped by their attempt key (parents, island, date, day, night),
+    so every distinct breeding attempt is only evaluated once.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Breeding data.
+
+    workers: int | None, default None
+        Amount of processes to spread the distinct attempts over.
+        If None or 1, everything runs in this process.
+
+    cache: ResultCache | None, default None
+        If given, only attempts that aren't in the cache are computed,
+        and those are added to it (and saved).
+
+    Returns
+    -------
+    codes: np.ndarray
+        For every row, the number of its distinct attempt.
+
+    unique_results: list
+        For every distinct attempt, the list of possible results.
+    """
+    if df.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), []
+    keys = attempt_keys(df)
+    codes = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    unique = keys.iloc[first_rows]
+    unique_keys = list(zip(
+        unique["parent1"].tolist(),
+        unique["parent2"].tolist(),
+        unique["island"].tolist(),
+        unique["date"].dt.date.tolist(),
+        unique["day"].tolist(), # Python bools
+        unique["night"].tolist(),
+    ))
+    if cache is None:
+        return codes, compute_attempt_results(unique_keys, workers)
+    new_keys = [unique_keys[i] for i in cache.missing(unique_keys)]
+    cache.update(new_keys, compute_attempt_results(new_keys, workers))
+    cache.save()
+    return codes, cache.get(unique_keys)
+
+def compute_attempt_results(keys: list, workers: int | None = None) -> list:
+    """
+    Determine the possible results of a list of attempt keys (parent1, parent2, island, date, day, night).
+    See unique_attempt_results for workers.
+    """
+    if workers is None or workers <= 1 or len(keys) == 0:
+        return _attempt_results_chunk(keys)
+
+    # A few chunks per worker to even out the load, results come back in order
+    chunk_size = -(-len(keys) // (workers * 4))
+    chunks = [keys[start:start + chunk_size] for start in range(0, len(keys), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rule_tables(),)) as executor:
+        return list(itertools.chain.from_iterable(executor.map(_attempt_results_chunk, chunks)))
+
+def possible_results_batch(df: pd.DataFrame, workers: int | None = None, cache: ResultCache | None = None) -> list:
+    """
+    Determine the possible results for every row of a dataframe at once.
+    See unique_attempt_results for workers and cache.
+
+    Returns
+    -------
+    results_list: list
+    One list of possible results per row, in the same order as df.
+    """
+    codes, unique_results = unique_attempt_results(df, workers, cache)
+    # Every row gets its own list, like possible_results would give
+    return [list(unique_results[code]) for code in codes]
+
+def possible_results_matrix(df: pd.DataFrame, vocabulary: MonsterVocabulary | None = None, workers: int | None = None,
+                            cache: ResultCache | None = None) -> OutcomeMatrix:
+    """
+    Determine the possible results for every row of a dataframe, as a sparse
+    row x monster matrix instead of a column of lists.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Breeding data.
+
+    vocabulary: MonsterVocabulary | None, default None
+        Monster IDs to use for the columns. If None, a new one is built from the rule files.
+
+    workers, cache:
+        See unique_attempt_results.
+    """
+    codes, unique_results = unique_attempt_results(df, workers, cache)
+    unique_outcomes = OutcomeMatrix.from_results(unique_results, vocabulary)
+    return OutcomeMatrix(unique_outcomes.matrix[codes], unique_outcomes.vocabulary, df.index)
+
+def outcomes_for(df: pd.DataFrame, outcomes: OutcomeMatrix | None = None, workers: int | None = None,
+                 cache: ResultCache | None = None) -> OutcomeMatrix:
+    """
+    Possible results of df as an OutcomeMatrix: outcomes itself if given (checked to line up with df),
+    else built from the "Possible results" column, or computed if there's none.
+    See unique_attempt_results for workers and cache.
+    """
+    if outcomes is not None:
+        if not outcomes.index.equals(df.index):
+            raise ValueError("Outcome matrix doesn't line up with the dataframe")
+        return outcomes
+    if "Possible results" in df.columns:
+        return OutcomeMatrix.from_results(df["Possible results"])
+    return possible_results_matrix(df, workers=workers, cache=cache)
+
+@instrument.instrumented()
+def add_possible_results_to_df(df, workers: int | None = None, cache: ResultCache | None = None):
+    """
+    Add a column "Possible results" to the breeding data.
+    Set workers to compute the results in that many processes.
+    Pass a ResultCache to only compute the results of attempts that weren't seen before, e.g.
+    add_possible_results_to_df(df, cache=ResultCache())
+    """
+    df['Possible results'] = possible_results_batch(df, workers, cache)
     return df
 
 if __name__ == "__main__":
     df = filereader.read_data()
     add_possible_results_to_df(df)
     # print(df[['Parent 1 Species', 'Parent 2 Species', 'Possible results']])
-    for _, row in df.iterrows():
-        if row["Result Monster"] not in row["Possible results"]:
-            print(row[["Parent 1 Species", "Parent 2 Species", "Result Monster"]])
\ No newline at end of file
+    # Rows whose result isn't in their possible results, grouped by cause (see audit.py for more options)
+    import audit # Imported here, audit itself uses this module
+    audit.print_report(audit.audit(df), df.shape[0])
\ No newline at end of file
@@ -0,0 +1,274 @@
+import numpy as np
+from vocabulary import MonsterVocabulary
+# The breeding rules of elements.txt and specials.txt compiled to integers:
+# every element is a bit in a mask and every monster has an ID (from a MonsterVocabulary).
+# Checking for shared elements is then a bitwise AND, and finding the monster with a
+# combination of elements an index into an array.
+
+NO_MONSTER = -1
+MAX_BASIC_OUTCOMES = 5 # Two parents and up to three rare singles
+
+class CompiledRules:
+    """
+    Integer-coded breeding rules.
+
+    Parameters
+    ----------
+    elements: dict
+        Keys are monster names, values are sorted tuples of elements (see filereader.read_elements).
+
+    reverse_elements: dict
+        Keys are sorted tuples of elements, values are monster names.
+
+    specials: dict
+        Keys are (parent1, parent2), values are lists of results (see filereader.read_specials).
+
+    vocabulary: MonsterVocabulary
+        Monster IDs to use. Monsters missing from it are added.
+
+    existing_rares: list
+        Monsters that have a rare version.
+
+    natural_singles: list
+        Monsters that only give the double when bred with each other,
+        and that only have a rare version on Shugabush Island.
+
+    ethereal_elements: list
+        Elements of Ethereal Island, where nothing with more than 2 elements gets bred.
+    """
+    def __init__(self, elements: dict, reverse_elements: dict, specials: dict, vocabulary: MonsterVocabulary,
+                 existing_rares: list, natural_singles: list, ethereal_elements: list):
+        self.vocabulary = vocabulary
+        all_elements = sorted({element for element_tuple in elements.values() for element in element_tuple})
+        # Bits in the same order as the elements in a sorted tuple
+        self.element_bits = {element: 1 << i for i, element in enumerate(all_elements)}
+        self.n_bits = len(all_elements)
+
+        for monster in list(elements) + list(reverse_elements.values()):
+            vocabulary.add(monster)
+        for single in [(element, ) for element in all_elements]:
+            if single in reverse_elements:
+                vocabulary.add("Rare " + reverse_elements[single])
+        for (parent1, parent2), results in specials.items():
+            vocabulary.add(parent1)
+            vocabulary.add(parent2)
+            for result in results:
+                vocabulary.add(result)
+        # Rare version of every monster, the Shugabush one also for natural singles
+        rare_ids = {vocabulary.add(monster): vocabulary.add("Rare " + monster) for monster in existing_rares}
+        shugabush_rare_ids = dict(rare_ids)
+        shugabush_rare_ids.update({vocabulary.add(monster): vocabulary.add("Rare " + monster) for monster in natural_singles})
+        size = len(vocabulary)
+
+        # Per monster ID
+        self.masks = np.zeros(size, dtype=np.int32)
+        self.element_counts = np.zeros(size, dtype=np.int8)
+        self.ethereal_first = np.zeros(size, dtype=bool) # First element (in sorted order) is ethereal
+        self.natural_single = np.zeros(size, dtype=bool)
+        for monster, element_tuple in elements.items():
+            monster_id = vocabulary.ids[monster]
+            self.masks[monster_id] = self.mask_of(element_tuple)
+            self.element_counts[monster_id] = len(element_tuple)
+            self.ethereal_first[monster_id] = element_tuple[0] in ethereal_elements
+        for monster in natural_singles:
+            self.natural_single[vocabulary.ids[monster]] = True
+        self.rare_ids = np.full(size, NO_MONSTER, dtype=np.int32)
+        self.rare_ids[list(rare_ids)] = list(rare_ids.values())
+        self.shugabush_rare_ids = np.full(size, NO_MONSTER, dtype=np.int32)
+        self.shugabush_rare_ids[list(shugabush_rare_ids)] = list(shugabush_rare_ids.values())
+        # Per mask
+        self.monster_by_mask = np.full(1 << self.n_bits, NO_MONSTER, dtype=np.int32)
+        for element_tuple, monster in reverse_elements.items():
+            self.monster_by_mask[self.mask_of(element_tuple)] = vocabulary.ids[monster]
+        # Per element bit
+        self.rare_single_by_bit = np.full(self.n_bits, NO_MONSTER, dtype=np.int32)
+        for element, bit in self.element_bits.items():
+            if (element, ) in reverse_elements:
+                self.rare_single_by_bit[bit.bit_length() - 1] = vocabulary.ids["Rare " + reverse_elements[(element, )]]
+
+        # Special combinations, keyed by parent1 * size + parent2
+        self.size = size
+        special_lists = {}
+        for (parent1, parent2), results in specials.items():
+            key = vocabulary.ids[parent1] * size + vocabulary.ids[parent2]
+            special_lists[key] = tuple(vocabulary.ids[result] for result in results)
+        self.special_results = special_lists
+        self.special_keys = np.array(sorted(special_lists), dtype=np.int64)
+
+        # Plain lists for the one-pair functions, indexing those is faster than numpy for single values
+        self._masks = self.masks.tolist()
+        self._counts = self.element_counts.tolist()
+        self._ethereal_first = self.ethereal_first.tolist()
+        self._natural_single = self.natural_single.tolist()
+        self._monster_by_mask = self.monster_by_mask.tolist()
+        self._rare_single_by_bit = self.rare_single_by_bit.tolist()
+        self._rare_ids = self.rare_ids.tolist()
+        self._shugabush_rare_ids = self.shugabush_rare_ids.tolist()
+
+    def mask_of(self, element_tuple) -> int:
+        mask = 0
+        for element in element_tuple:
+            mask |= self.element_bits[element]
+        return mask
+
+    def monster_id(self, monster: str) -> int:
+        """
+        ID of a monster name, adding unknown monsters to the vocabulary.
+        """
+        monster_id = self.vocabulary.add(monster)
+        if monster_id >= len(self._masks):
+            self._grow()
+        return monster_id
+
+    def element_count(self, monster_id: int) -> int:
+        """
+        Amount of elements of a monster, 0 if it has no registered elements.
+        """
+        return self._counts[monster_id]
+
+    def ids(self, monsters) -> np.ndarray:
+        """
+        IDs of monster names, adding unknown monsters to the vocabulary.
+        Unknown monsters have no elements and aren't in any special combination.
+        """
+        ids = np.fromiter((self.vocabulary.add(monster) for monster in monsters), dtype=np.int64)
+        if len(self.vocabulary) > len(self.masks):
+            self._grow()
+        return ids
+
+    def _grow(self) -> None:
+        extra = len(self.vocabulary) - len(self.masks)
+        self.masks = np.concatenate([self.masks, np.zeros(extra, dtype=self.masks.dtype)])
+        self.element_counts = np.concatenate([self.element_counts, np.zeros(extra, dtype=self.element_counts.dtype)])
+        self.ethereal_first = np.concatenate([self.ethereal_first, np.zeros(extra, dtype=bool)])
+        self.natural_single = np.concatenate([self.natural_single, np.zeros(extra, dtype=bool)])
+        self.rare_ids = np.concatenate([self.rare_ids, np.full(extra, NO_MONSTER, dtype=self.rare_ids.dtype)])
+        self.shugabush_rare_ids = np.concatenate([self.shugabush_rare_ids, np.full(extra, NO_MONSTER, dtype=self.shugabush_rare_ids.dtype)])
+        self._masks.extend([0] * extra)
+        self._counts.extend([0] * extra)
+        self._ethereal_first.extend([False] * extra)
+        self._natural_single.extend([False] * extra)
+        self._rare_ids.extend([NO_MONSTER] * extra)
+        self._shugabush_rare_ids.extend([NO_MONSTER] * extra)
+
+    def basic_pair(self, parent1: int, parent2: int) -> tuple:
+        """
+        'Regular' breeding of two (common) parent IDs, like breeder.basic_breeding.
+        Raises KeyError if the combination of elements has no monster.
+        """
+        mask1 = self._masks[parent1]
+        mask2 = self._masks[parent2]
+        if mask1 == 0 or mask2 == 0: # Parents without registered elements
+            return (parent1, parent2)
+        shared = mask1 & mask2
+        if self._counts[parent1] == 3 and self._counts[parent2] == 3: # Rare singles
+            outcomes = (parent1, parent2)
+            bit = 0
+            while shared:
+                if shared & 1:
+                    rare_single = self._rare_single_by_bit[bit]
+                    if rare_single == NO_MONSTER:
+                        raise KeyError(bit)
+                    outcomes = outcomes + (rare_single, )
+                shared >>= 1
+                bit += 1
+            return outcomes
+        if shared:
+            return (parent1, parent2)
+        if self._ethereal_first[parent1] and self._counts[parent1] + self._counts[parent2] >= 3:
+            return (parent1, parent2)
+        new_monster = self._monster_by_mask[mask1 | mask2]
+        if new_monster == NO_MONSTER:
+            raise KeyError(mask1 | mask2)
+        if self._natural_single[parent1] and self._natural_single[parent2]:
+            return (new_monster, )
+        return (parent1, parent2, new_monster)
+
+    def basic_many(self, parents1: np.ndarray, parents2: np.ndarray) -> tuple:
+        """
+        'Regular' breeding of many pairs of (common) parent IDs at once.
+
+        Returns
+        -------
+        outcomes: np.ndarray
+            Shape (pairs, MAX_BASIC_OUTCOMES), the outcome IDs of every pair in the same
+            order as basic_pair, padded with NO_MONSTER.
+
+        missing: np.ndarray
+            Boolean, True for pairs where basic_pair would raise KeyError.
+        """
+        parents1 = np.asarray(parents1, dtype=np.int64)
+        parents2 = np.asarray(parents2, dtype=np.int64)
+        mask1 = self.masks[parents1]
+        mask2 = self.masks[parents2]
+        count1 = self.element_counts[parents1]
+        count2 = self.element_counts[parents2]
+        shared = mask1 & mask2
+        registered = (mask1 != 0) & (mask2 != 0)
+        triples = registered & (count1 == 3) & (count2 == 3)
+
+        outcomes = np.full((len(parents1), MAX_BASIC_OUTCOMES), NO_MONSTER, dtype=np.int64)
+        outcomes[:, 0] = parents1
+        outcomes[:, 1] = parents2
+        missing = np.zeros(len(parents1), dtype=bool)
+
+        # Rare singles, one column for every shared element
+        rows = np.arange(len(parents1))
+        position = np.full(len(parents1), 2)
+        for bit in range(self.n_bits):
+            has = triples & ((shared >> bit) & 1).astype(bool)
+            outcomes[rows[has], position[has]] = self.rare_single_by_bit[bit]
+            missing |= has & (self.rare_single_by_bit[bit] == NO_MONSTER)
+            position += has
+
+        # New monster out of two parents without shared elements
+        breeds = registered & ~triples & (shared == 0)
+        breeds &= ~(self.ethereal_first[parents1] & (count1.astype(np.int64) + count2 >= 3))
+        new_monsters = self.monster_by_mask[mask1 | mask2]
+        missing |= breeds & (new_monsters == NO_MONSTER)
+        only_double = breeds & self.natural_single[parents1] & self.natural_single[parents2]
+        outcomes[breeds, 2] = new_monsters[breeds]
+        outcomes[only_double, 0] = new_monsters[only_double]
+        outcomes[only_double, 1:] = NO_MONSTER
+        return outcomes, missing
+
+    def special_pair(self, parent1: int, parent2: int) -> tuple:
+        """
+        Special results (from specials.txt) of two (common) parent IDs.
+        """
+        if parent1 >= self.size or parent2 >= self.size: # Added later on, so no special combination
+            return ()
+        return self.special_results.get(parent1 * self.size + parent2, ())
+
+    def has_special(self, parents1: np.ndarray, parents2: np.ndarray) -> np.ndarray:
+        """
+        Boolean array, True for pairs of parent IDs with a special combination.
+        """
+        parents1 = np.asarray(parents1, dtype=np.int64)
+        parents2 = np.asarray(parents2, dtype=np.int64)
+        keys = parents1 * self.size + parents2
+        if len(self.special_keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.special_keys, keys), len(self.special_keys) - 1)
+        return (self.special_keys[positions] == keys) & (parents1 < self.size) & (parents2 < self.size)
+
+    def rareify(self, ids, shugabush: bool = False) -> tuple:
+        """
+        Add the rare version after every monster ID that has one, like breeder.rareify.
+        """
+        rare_ids = self._shugabush_rare_ids if shugabush else self._rare_ids
+        outcomes = ()
+        for monster_id in ids:
+            rare_id = rare_ids[monster_id]
+            if rare_id == NO_MONSTER:
+                outcomes = outcomes + (monster_id, )
+            else:
+                outcomes = outcomes + (monster_id, rare_id)
+        return outcomes
+
+    def names(self, ids) -> list:
+        """
+        Monster names of IDs, skipping NO_MONSTER.
+        """
+        monsters = self.vocabulary.monsters
+        return [monsters[monster_id] for monster_id in ids if monster_id != NO_MONSTER]
@@ -0,0 +1,315 @@
+import argparse
+import datetime
+import sys
+import time
+import numpy as np
+import pandas as pd
+import breeder
+import filereader
+import reference
+from compiledrules import NO_MONSTER
+from resultcache import ResultCache
+# Differential checks: random breeding attempts go through the original implementation
+# in reference.py and through every faster engine, which all have to give the exact same output.
+# Attempts are drawn with extra weight on the edge cases: Ethereal Island, natural singles,
+# Shugabush, mirror islands with paironormals, special combinations and unknown monsters.
+
+UNKNOWN_MONSTER = "Unknown Monster" # Parent without any rules
+DATE_MARGIN = 60 # Days before the first and after the last event to draw dates from
+
+class Pools:
+    """
+    Monsters, islands and dates to draw random attempts from, taken from the rule files.
+    """
+    def __init__(self):
+        rules = filereader.rules
+        elements = rules.elements
+        self.monsters = sorted(set(elements) | {monster for pair in rules.specials for monster in pair} | {UNKNOWN_MONSTER})
+        self.specials = sorted(rules.specials)
+        self.natural_singles = [monster for monster in reference.natural_singles if monster in elements]
+        self.ethereals = sorted(monster for monster in elements if elements[monster][0] in reference.ethereal_elements)
+        self.triples = sorted(monster for monster in elements if len(elements[monster]) == 3)
+        self.quads = sorted(monster for monster in elements if len(elements[monster]) == 4)
+        self.rares = set(rules.existing_rares)
+
+        islands = list(rules.always_available)
+        self.islands = islands + ["M " + island for island in islands]
+        self.pairo_islands = list(reference.ethereal_pairo) + ["M " + island for island in reference.ethereal_pairo]
+
+        _, special_availabilities = reference.availabilities()
+        days = sorted(special_availabilities)
+        self.first_date = days[0] - datetime.timedelta(days=DATE_MARGIN)
+        self.n_dates = (days[-1] - days[0]).days + 2 * DATE_MARGIN
+
+    def parents(self, rng: np.random.Generator, n: int) -> list:
+        """
+        Random pairs of common parents, a mix of uniformly drawn parents and edge cases.
+        """
+        kind = rng.choice(5, size=n, p=[0.4, 0.15, 0.15, 0.15, 0.15])
+        pairs = []
+        for k in kind:
+            if k == 0:
+                pair = tuple(rng.choice(self.monsters, size=2))
+            elif k == 1:
+                pair = self.specials[rng.integers(len(self.specials))]
+            elif k == 2:
+                pair = tuple(rng.choice(self.natural_singles, size=2))
+            elif k == 3:
+                pair = tuple(rng.choice(self.ethereals, size=2))
+            else:
+                pair = (rng.choice(self.triples), rng.choice(self.quads))
+            pairs.append(tuple(str(monster) for monster in (pair if rng.random() < 0.5 else pair[::-1])))
+        return pairs
+
+    def islands_for(self, rng: np.random.Generator, n: int) -> list:
+        kind = rng.choice(4, size=n, p=[0.5, 0.15, 0.15, 0.2])
+        islands = []
+        for k in kind:
+            if k == 0:
+                islands.append(str(rng.choice(self.islands)))
+            elif k == 1:
+                islands.append("Shugabush")
+            elif k == 2:
+                islands.append("Ethereal" if rng.random() < 0.5 else "M Ethereal")
+            else:
+                islands.append(str(rng.choice(self.pairo_islands)))
+        return islands
+
+    def dates(self, rng: np.random.Generator, n: int) -> list:
+        offsets = rng.integers(0, self.n_dates, size=n)
+        return [self.first_date + datetime.timedelta(days=int(offset)) for offset in offsets]
+
+    def rarify(self, rng: np.random.Generator, monster: str) -> str:
+        # Sometimes use the rare version of a parent, if it exists
+        if monster in self.rares and rng.random() < 0.3:
+            return "Rare " + monster
+        return monster
+
+def attempts(pools: Pools, rng: np.random.Generator, n: int) -> list:
+    """
+    Random attempt keys (parent1, parent2, island, date, day, night), see breeder.attempt_results.
+    Day and night are mostly bools, but sometimes values that aren't exactly True.
+    Parents are drawn as common monsters, and sometimes made rare.
+    """
+    flags = [True, False, True, False, 1, "TRUE", None]
+    # Parents that combine to elements without a monster can't be bred at all
+    # (both implementations raise KeyError, see the basic_breeding check)
+    pairs = []
+    while len(pairs) < n:
+        pairs += [pair for pair in pools.parents(rng, n - len(pairs))
+                  if _or_error(reference.basic_breeding, *pair) != "KeyError"]
+    islands = pools.islands_for(rng, n)
+    dates = pools.dates(rng, n)
+    days = rng.integers(len(flags), size=n)
+    nights = rng.integers(len(flags), size=n)
+    return [
+        (pools.rarify(rng, parent1), pools.rarify(rng, parent2), island, date, flags[day], flags[night])
+        for (parent1, parent2), island, date, day, night in zip(pairs, islands, dates, days, nights)
+    ]
+
+def _attempts_df(cases: list) -> pd.DataFrame:
+    # The attempts as breeding data, like filereader.read_data gives
+    parent1, parent2, island, date, day, night = zip(*cases)
+    return pd.DataFrame({
+        "Parent 1 Species": list(parent1),
+        "Parent 2 Species": list(parent2),
+        "Island": list(island),
+        "Date (MSM time) (MM/DD/YYYY)": pd.to_datetime(list(date)),
+        "Day? (Local, 6am-8pm)": pd.Series(list(day), dtype=object),
+        "Night? (Local, 6am-8pm)": pd.Series(list(night), dtype=object),
+    })
+
+def _or_error(function, *args):
+    # Exceptions are part of the output: the reference raises KeyError for some parents
+    try:
+        return function(*args)
+    except Exception as error:
+        return type(error).__name__
+
+def _compiled_basic(cases: list) -> list:
+    compiled = breeder.compiled_rules()
+    parents1 = compiled.ids([parent1 for parent1, _ in cases])
+    parents2 = compiled.ids([parent2 for _, parent2 in cases])
+    outcomes, missing = compiled.basic_many(parents1, parents2)
+    known = np.array([compiled.element_count(p1) > 0 and compiled.element_count(p2) > 0 for p1, p2 in zip(parents1, parents2)])
+    monsters = compiled.vocabulary.monsters
+    return [
+        "KeyError" if is_missing else [monsters[i] for i in row if i != NO_MONSTER] if is_known else list(case)
+        for row, is_missing, is_known, case in zip(outcomes.tolist(), missing, known, cases)
+    ]
+
+def _compiled_rareify(cases: list) -> list:
+    compiled = breeder.compiled_rules()
+    return [
+        compiled.names(compiled.rareify(compiled.ids([monsters] if type(monsters) is str else monsters), shugabush))
+        for monsters, shugabush in cases
+    ]
+
+def _available_mask(cases: list) -> list:
+    # One vectorized lookup per monster
+    special_availabilities = filereader.rules.special_availabilities
+    frame = pd.DataFrame(cases, columns=["monster", "date"])
+    available = np.zeros(len(cases), dtype=bool)
+    for monster, rows in frame.groupby("monster", sort=False).indices.items():
+        available[rows] = special_availabilities.available_mask(monster, frame["date"].to_numpy()[rows])
+    return available.tolist()
+
+def _available_on_many(cases: list) -> list:
+    monsters, dates = zip(*cases)
+    available = filereader.rules.special_availabilities.available_on_many(list(dates))
+    return [monster in on_date for monster, on_date in zip(monsters, available)]
+
+def _reference_available(monster: str, date) -> bool:
+    _, special_availabilities = reference.availabilities()
+    return date in special_availabilities and monster in special_availabilities[date]
+
+def _cached_batch(cases: list) -> list:
+    # Half the attempts are in the cache before, like a new run on a grown sheet
+    df = _attempts_df(cases)
+    cache = ResultCache(path=None)
+    breeder.possible_results_batch(df.iloc[:len(df) // 2], cache=cache)
+    return breeder.possible_results_batch(df, cache=cache)
+
+def checks(pools: Pools, rng: np.random.Generator, n: int) -> dict:
+    """
+    Everything to compare. Per check: the random cases, the reference function (one case at a time),
+    the engines (all cases at once) and whether their output has to be exactly the same
+    (instead of the same set of monsters).
+    """
+    attempt_cases = attempts(pools, rng, n)
+    pair_cases = pools.parents(rng, n)
+    special_cases = [(parent1, parent2, reference.demirror(island)) for (parent1, parent2), island in zip(pair_cases, pools.islands_for(rng, n))]
+    outcome_cases = [(parent1, parent2, island) for (parent1, parent2), island in zip(pair_cases, pools.islands_for(rng, n))]
+    sizes = rng.integers(0, 6, size=n)
+    rareify_cases = [
+        (str(rng.choice(pools.monsters)) if size == 0 else [str(monster) for monster in rng.choice(pools.monsters, size=size)], bool(rng.random() < 0.3))
+        for size in sizes
+    ]
+    availability_monsters = sorted({monster for monsters in reference.availabilities()[1].values() for monster in monsters}) + pools.monsters[:20]
+    availability_cases = list(zip([str(monster) for monster in rng.choice(availability_monsters, size=n)], pools.dates(rng, n)))
+    always_cases = list(filereader.rules.always_available)
+
+    return {
+        "possible_results": (attempt_cases, lambda case: reference.attempt_results(*case), {
+            "attempt_results": (lambda cases: [breeder.attempt_results(*case) for case in cases], True),
+            "possible_results_batch": (lambda cases: breeder.possible_results_batch(_attempts_df(cases)), True),
+            "possible_results_matrix": (lambda cases: breeder.possible_results_matrix(_attempts_df(cases)).to_lists(), False),
+            "possible_results_batch (cached)": (_cached_batch, True),
+        }),
+        "basic_breeding": (pair_cases, lambda case: _or_error(reference.basic_breeding, *case), {
+            "basic_breeding": (lambda cases: [_or_error(breeder.basic_breeding, *case) for case in cases], True),
+            "compiled basic_many": (_compiled_basic, True),
+        }),
+        "special_breeding": (special_cases, lambda case: reference.special_breeding(*case), {
+            "special_breeding": (lambda cases: [breeder.special_breeding(*case) for case in cases], True),
+        }),
+        "breeding_outcomes": (outcome_cases, lambda case: _or_error(lambda parent1, parent2, island: reference.rareify(
+                reference.basic_breeding(parent1, parent2) + reference.special_breeding(parent1, parent2, reference.demirror(island)),
+                island == "Shugabush"), *case), {
+            "breeding_outcomes": (lambda cases: [_or_error(breeder.breeding_outcomes, *case) for case in cases], True),
+            "outcome_table": (lambda cases: [_or_error(lambda *key: list(breeder.outcome_table.lookup(*key)), *case) for case in cases], True),
+        }),
+        "rareify": (rareify_cases, lambda case: reference.rareify(*case), {
+            "rareify": (lambda cases: [breeder.rareify(*case) for case in cases], True),
+            "compiled rareify": (_compiled_rareify, True),
+        }),
+        "read_availability (events)": (availability_cases, lambda case: _reference_available(*case), {
+            "is_available": (lambda cases: [filereader.rules.special_availabilities.is_available(*case) for case in cases], True),
+            "available_mask": (_available_mask, True),
+            "available_on_many": (_available_on_many, True),
+        }),
+        "read_availability (always)": (always_cases, lambda island: reference.availabilities()[0][island], {
+            "always_available": (lambda cases: [filereader.rules.always_available[island] for island in cases], True),
+        }),
+    }
+
+def _same(expected, got, exact: bool) -> bool:
+    # Engines that store sets of results (the outcome matrix) lose the order and duplicates
+    if exact or not isinstance(expected, list) or not isinstance(got, list):
+        return expected == got
+    return set(expected) == set(got)
+
+def run(n: int = 20000, seed: int = 0, only: list | None = None, examples: int = 5) -> tuple:
+    """
+    Run every check on n random cases.
+
+    Parameters
+    ----------
+    n: int, default 20000
+        Amount of random cases per check.
+
+    seed: int, default 0
+        Seed for drawing the cases.
+
+    only: list | None, default None
+        Names of the checks to run. If None, runs all of them.
+
+    examples: int, default 5
+        Most mismatching cases to keep per engine.
+
+    Returns
+    -------
+    report: pd.DataFrame
+        One row per check and engine (the reference included): amount of cases,
+        mismatches with the reference, seconds and cases per second.
+
+    mismatches: dict
+        Keys are (check, engine), values are lists of (case, expected, got).
+    """
+    rng = np.random.default_rng(seed)
+    pools = Pools()
+    # Build the lazy tables first, so they don't count towards the first engine's time
+    breeder.outcome_table.table
+    breeder.compiled_rules()
+    filereader.rules.special_availabilities
+
+    rows = []
+    mismatches = {}
+    for name, (cases, reference_function, engines) in checks(pools, rng, n).items():
+        if only is not None and name not in only:
+            continue
+        start = time.perf_counter()
+        expected = [reference_function(case) for case in cases]
+        seconds = time.perf_counter() - start
+        rows.append((name, "reference", len(cases), 0, seconds))
+        for engine, (function, exact) in engines.items():
+            start = time.perf_counter()
+            got = function(cases)
+            seconds = time.perf_counter() - start
+            wrong = [(case, exp, out) for case, exp, out in zip(cases, expected, got) if not _same(exp, out, exact)]
+            if len(got) != len(expected):
+                wrong.append((None, len(expected), len(got)))
+            if wrong:
+                mismatches[(name, engine)] = wrong[:examples]
+            rows.append((name, engine, len(cases), len(wrong), seconds))
+    report = pd.DataFrame(rows, columns=["check", "engine", "cases", "mismatches", "seconds"])
+    report["cases/s"] = (report["cases"] / report["seconds"]).round()
+    return report, mismatches
+
+def assert_identical(n: int = 20000, seed: int = 0) -> pd.DataFrame:
+    """
+    Run all checks and raise AssertionError if any engine differs from the reference.
+    """
+    report, mismatches = run(n, seed)
+    if mismatches:
+        raise AssertionError("Engines differ from the reference: {}".format(mismatches))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check every breeding engine against the reference implementation on random attempts.")
+    parser.add_argument("--cases", type=int, default=20000,
+                        help="Random cases per check")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for drawing the cases")
+    parser.add_argument("--only", nargs="+", default=None,
+                        help="Only run these checks")
+    args = parser.parse_args()
+
+    report, mismatches = run(args.cases, args.seed, args.only)
+    print(report.to_string(index=False))
+    for (name, engine), wrong in mismatches.items():
+        print()
+        print("{} / {}:".format(name, engine))
+        for case, expected, got in wrong:
+            print("  {}\n    expected {}\n    got      {}".format(case, expected, got))
+    sys.exit(1 if mismatches else 0)
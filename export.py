@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import breeder
+import filereader
+import snapshot
+from outcomes import OutcomeMatrix
+# Writing the possible results to files that line up with the master sheet,
+# through the "Sheet row" column filereader.read_data adds.
+
+XLSX_MAX_ROWS = 1048576 # Including the header row
+
+def sheet_rows(df: pd.DataFrame) -> np.ndarray:
+    """
+    Row numbers in the master sheet, or the index if df doesn't have a "Sheet row" column
+    (e.g. data read with an older version).
+    """
+    if filereader.SHEET_ROW_COLUMN in df.columns:
+        return df[filereader.SHEET_ROW_COLUMN].to_numpy()
+    return df.index.to_numpy()
+
+def possible_results_long(df: pd.DataFrame, outcomes: OutcomeMatrix | None = None) -> pd.DataFrame:
+    """
+    Possible results as one row per (sheet row, possible result).
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Breeding data from filereader.read_data.
+
+    outcomes: OutcomeMatrix | None, default None
+        Possible results of df (see breeder.possible_results_matrix). If None, they're taken
+        from the "Possible results" column, or computed if there's none.
+
+    Returns
+    -------
+    long: pd.DataFrame
+        Columns "Sheet row" and "Possible result" (categorical).
+    """
+    outcomes = breeder.outcomes_for(df, outcomes)
+    matrix = outcomes.matrix
+    per_row = np.diff(matrix.indptr)
+    return pd.DataFrame({
+        filereader.SHEET_ROW_COLUMN: np.repeat(sheet_rows(df), per_row),
+        "Possible result": pd.Categorical.from_codes(matrix.indices, categories=outcomes.vocabulary.monsters),
+    })
+
+def possible_results_wide(df: pd.DataFrame, outcomes: OutcomeMatrix | None = None) -> pd.DataFrame:
+    """
+    Possible results as one row per sheet row and one boolean column per monster
+    that's a possible result of any row. See possible_results_long for the parameters.
+    """
+    outcomes = breeder.outcomes_for(df, outcomes)
+    matrix = outcomes._aligned()
+    present = np.flatnonzero(np.bincount(matrix.indices, minlength=matrix.shape[1]))
+    dense = matrix[:, present].toarray()
+    wide = pd.DataFrame(dense, columns=np.array(outcomes.vocabulary.monsters, dtype=object)[present])
+    wide.insert(0, filereader.SHEET_ROW_COLUMN, sheet_rows(df))
+    return wide
+
+def _write_wide_csv(table: pd.DataFrame, path: str, chunksize: int = 50000) -> None:
+    # pandas formats every 0/1 cell on its own, which gets slow with hundreds of columns.
+    # The cells are single digits, so whole rows can be built as bytes at once.
+    rows = table.iloc[:, 0].to_numpy()
+    cells = table.iloc[:, 1:].to_numpy(dtype=np.uint8)
+    n_columns = cells.shape[1]
+    with open(path, "w", newline="") as f:
+        table.iloc[:0].to_csv(f, index=False)
+    with open(path, "ab") as f:
+        for start in range(0, len(rows), chunksize):
+            chunk = cells[start:start + chunksize]
+            line = np.empty((chunk.shape[0], 2 * n_columns + 1), dtype=np.uint8)
+            line[:, 0:2 * n_columns:2] = ord(",")
+            line[:, 1:2 * n_columns:2] = chunk + ord("0")
+            line[:, -1] = ord("\n")
+            f.write(b"".join(str(row).encode() + rest for row, rest in zip(rows[start:start + chunksize].tolist(), map(bytes, line))))
+
+def _write_xlsx(table: pd.DataFrame, path: str) -> None:
+    # Row by row with a write-only workbook, so memory use doesn't grow with the file
+    if table.shape[0] + 1 > XLSX_MAX_ROWS:
+        raise ValueError("Too many rows for an xlsx file ({}), use csv or parquet instead".format(table.shape[0]))
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("Writing xlsx files needs openpyxl, use csv or parquet instead")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Possible results")
+    sheet.append([str(col) for col in table.columns])
+    for row in table.itertuples(index=False, name=None):
+        sheet.append(row)
+    workbook.save(path)
+
+def export_possible_results(df: pd.DataFrame, path: str, layout: str = "long", outcomes: OutcomeMatrix | None = None) -> pd.DataFrame:
+    """
+    Write the possible results of the breeding data to a file that lines up with the master sheet.
+    The file type follows from the extension: .csv, .parquet (needs pyarrow) or .xlsx (needs openpyxl).
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Breeding data from filereader.read_data.
+
+    path: str
+        File to write to.
+
+    layout: str, default "long"
+        "long" for one row per (sheet row, possible result), "wide" for one row per sheet row
+        with a column per monster (1 if it's a possible result, 0 if not).
+
+    outcomes: OutcomeMatrix | None, default None
+        See possible_results_long.
+
+    Returns
+    -------
+    table: pd.DataFrame
+        The table that was written.
+    """
+    if layout == "long":
+        table = possible_results_long(df, outcomes)
+    elif layout == "wide":
+        table = possible_results_wide(df, outcomes)
+        monsters = table.columns[1:]
+        table[monsters] = table[monsters].astype(np.uint8) # 0/1 is a lot shorter than False/True
+    else:
+        raise ValueError("Unknown layout {}, use 'long' or 'wide'".format(layout))
+
+    extension = path.rsplit(".", 1)[-1].lower()
+    if extension == "csv" and layout == "wide":
+        _write_wide_csv(table, path)
+    elif extension == "csv":
+        table.to_csv(path, index=False)
+    elif extension == "parquet":
+        if not snapshot.HAS_PARQUET:
+            raise ImportError("Writing parquet files needs pyarrow, use csv instead")
+        table.to_parquet(path, index=False)
+    elif extension == "xlsx":
+        _write_xlsx(table, path)
+    else:
+        raise ValueError("Unknown file type {}, use .csv, .parquet or .xlsx".format(extension))
+    return table
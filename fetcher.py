@@ -0,0 +1,168 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+# Downloading the sheets: both at the same time, streamed to disk, and only when they changed
+# (ETag / If-Modified-Since), with retries for the occasional network hiccup.
+# A Fetcher can be passed as the fetch argument of filereader.read_data.
+
+CACHE_DIR = "sheet_cache"
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+BLOCK_SIZE = 1 << 16
+
+class Fetcher:
+    """
+    Downloads CSV files to a local cache directory, and reads them like pd.read_csv.
+
+    Parameters
+    ----------
+    cache_dir: str, default CACHE_DIR
+        Where to keep the downloaded files, with their ETag and Last-Modified headers.
+
+    timeout: float, default 30
+        Seconds to wait for the server (per connection attempt and per read).
+
+    retries: int, default 3
+        How many times to try again after a network error or a server error (5xx, 408, 429).
+
+    backoff: float, default 0.5
+        Seconds to wait before the first retry, doubling every retry.
+
+    workers: int, default 4
+        Most downloads at the same time.
+
+    Example
+    -------
+    fetcher = Fetcher()
+    df = filereader.read_data(fetch=fetcher)
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, timeout: float = 30, retries: int = 3, backoff: float = 0.5, workers: int = 4):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.workers = workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str) -> tuple:
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + ".csv"), os.path.join(self.cache_dir, name + ".json")
+
+    def _request(self, url: str, path: str, meta_path: str) -> urllib.request.Request:
+        # Ask for the file only if it changed since the cached copy
+        headers = {}
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return urllib.request.Request(url, headers=headers)
+
+    def _download_once(self, url: str) -> str:
+        path, meta_path = self._paths(url)
+        request = self._request(url, path, meta_path)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as error:
+            if error.code == 304: # Not modified, the cached copy is still right
+                error.close()
+                return path
+            raise
+        with response:
+            # Stream to a temporary file first, so a broken download never replaces a good copy
+            temporary = path + ".part"
+            with open(temporary, "wb") as f:
+                while True:
+                    block = response.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    f.write(block)
+            os.replace(temporary, path)
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+        return path
+
+    def download(self, url: str) -> str:
+        """
+        Download a file to the cache directory (unless the cached copy is up to date)
+        and return its path. Network errors and server errors are retried with backoff,
+        the last error is raised if every try fails. All errors are OSErrors.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for attempt in range(self.retries + 1):
+            try:
+                return self._download_once(url)
+            except urllib.error.HTTPError as error:
+                if error.code not in RETRY_STATUSES or attempt == self.retries:
+                    raise
+            except OSError: # Includes URLError, timeouts and refused connections
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def prefetch(self, urls: list) -> None:
+        """
+        Start downloading the files in the background. The next call for each of
+        these urls waits for its download instead of starting a new one.
+        Downloads that finished without being used are started again, so they're never stale.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            for url in urls:
+                if url not in self._pending or self._pending[url].done():
+                    self._pending[url] = self._executor.submit(self.download, url)
+
+    def download_all(self, urls: list) -> dict:
+        """
+        Download several files at once. Returns a dict from url to path.
+        """
+        self.prefetch(urls)
+        return {url: self._path_of(url) for url in urls}
+
+    def _path_of(self, url: str) -> str:
+        with self._lock:
+            future = self._pending.pop(url, None)
+        if future is None:
+            return self.download(url)
+        return future.result()
+
+    def __call__(self, url: str, **kwargs) -> pd.DataFrame:
+        """
+        Same as pd.read_csv(url, **kwargs), but through the cache directory.
+        """
+        return pd.read_csv(self._path_of(url), **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            self._pending = {}
+
+_default_fetcher = None
+
+def default_fetcher() -> Fetcher:
+    """
+    Fetcher used by filereader.read_data when no fetch function is given.
+    """
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = Fetcher()
+    return _default_fetcher
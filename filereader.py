@@ -1,5 +1,10 @@
+import os
 import pandas as pd
 import numpy as np
+import instrument
+from availability import AvailabilityIndex
+import schema
+import snapshot
 
 
 def remove_comments(input_text):
@@ -37,7 +42,7 @@ def remove_comments(input_text):
 
 
 # Import special breeding combinations
-def read_specials(include_reverse = False):
+def read_specials(include_reverse = False, data_dir: str = "."):
     """
     Read the file containing all special breeding combinations.
 
@@ -46,6 +51,9 @@ def read_specials(include_reverse = False):
     include_reverse: bool, default False
     Whether or not to return the reverse breeding combination.
 
+    data_dir: str, default "."
+    Directory containing the data files.
+
     Returns
     -------
     breeding_dict
@@ -53,9 +61,10 @@ def read_specials(include_reverse = False):
     Entries are present for (parent1, parent2) and (parent2, parent1).
 
     reverse_breeding_dict
-    Keys are monster names, values are a tuple of monster names.
+    Keys are monster names, values are lists of (parent1, parent2) tuples,
+    one for every combination that gives the monster.
     """
-    with open("specials.txt") as f:
+    with open(os.path.join(data_dir, "specials.txt")) as f:
         commented_lines = f.readlines()
     lines = remove_comments(commented_lines)
     breeding_dict = {}
@@ -77,18 +86,23 @@ def read_specials(include_reverse = False):
         # else:
         #     breeding_dict[(parent1, parent2)] = result
         #     breeding_dict[(parent2, parent1)] = result
-        reverse_breeding_dict[result] = (parent1, parent2)
+        reverse_breeding_dict.setdefault(result, []).append((parent1, parent2))
     if include_reverse:
         return breeding_dict, reverse_breeding_dict
     else:
         return breeding_dict
 
 # Import elements of the guys
-def read_elements():
+def read_elements(data_dir: str = "."):
     """
     Read the file containing the elements of all monsters where the elements are
     relevant for breeding.
 
+    Parameters
+    ----------
+    data_dir: str, default "."
+    Directory containing the data files.
+
     Returns
     -------
     monster_dict
@@ -98,7 +112,7 @@ def read_elements():
     Keys are a sorted tuple of elements, values are monster names
     """
     # Warning: Deja-Jin and T-Rox have a dash in their names
-    with open("elements.txt") as f:
+    with open(os.path.join(data_dir, "elements.txt")) as f:
         commented_lines = f.readlines()
     lines = remove_comments(commented_lines)
     monster_dict = {}
@@ -111,27 +125,22 @@ def read_elements():
         elements_dict[element_tuple] = monster
     return monster_dict, elements_dict
 
-def read_existing_rares():
-    with open("existing_rares.txt") as f:
+def read_existing_rares(data_dir: str = "."):
+    with open(os.path.join(data_dir, "existing_rares.txt")) as f:
         commented = f.readlines()
     lines = remove_comments(commented)
     return [line.rstrip("\n") for line in lines]
 
-def read_groups():
-    df = pd.read_csv("groups.csv")
+def read_groups(data_dir: str = "."):
+    df = pd.read_csv(os.path.join(data_dir, "groups.csv"))
     listed = []
     for _, row in df.iterrows():
         listed.append(row["monsters"].split(','))
     df["monsters"] = listed
     return df
 
-elements, reverse_elements = read_elements()
-specials = read_specials()
-existing_rares = read_existing_rares()
-groups = read_groups()
-
 def get_group(groupname: str) -> list:
-    return list(groups[groups["group name"] == groupname]["monsters"])[0]
+    return rules.group_dict[groupname]
 
 def build_monster_list(remaining_elements):
     if len(remaining_elements) == 1:
@@ -148,9 +157,31 @@ def build_monster_list(remaining_elements):
 
 
 # Import availability data
-def read_availability():
+def read_availability(data_dir: str = ".", reverse_elements: dict | None = None):
+    """
+    Read which monsters are available on which island, and which are available
+    during events.
+
+    Parameters
+    ----------
+    data_dir: str, default "."
+    Directory containing the data files.
+
+    reverse_elements: dict | None, default None
+    Output of read_elements, read from data_dir if None.
+
+    Returns
+    -------
+    always_available
+    Keys are island names, values are lists of monsters.
+
+    special_availabilities: AvailabilityIndex
+    Monsters available through events.
+    """
+    if reverse_elements is None:
+        _, reverse_elements = read_elements(data_dir)
     always_available = {}
-    with open("always_available.txt") as f:
+    with open(os.path.join(data_dir, "always_available.txt")) as f:
         commented_lines = f.readlines()
     lines = remove_comments(commented_lines)
     for line in lines:
@@ -179,78 +210,122 @@ def read_availability():
         else:
             always_available[island] = monster_list
         
-    special_availabilities = {}
-    df = pd.read_csv("availabilities.csv")
+    df = pd.read_csv(os.path.join(data_dir, "availabilities.csv"))
     # Get from file: start date, stop date, list of monsters
-    df["startdate"] = pd.to_datetime(df["startdate"])
-    df["stopdate"] = pd.to_datetime(df["stopdate"])
-    monster_lists = []
-    for row in df['monsters']:
-        monster_lists.append(row.split(","))
-    df["monsters"] = monster_lists
-    # Get in dict: day, all available monsters
-    records = []
-    for _, row in df.iterrows():
-        days = pd.date_range(row["startdate"], row["stopdate"], freq='D', inclusive='left')
-        for day in days:
-            records.append((day.date(), row["monsters"]))
-    
-    for day, monsters in records:
-        special_availabilities[day] = special_availabilities.setdefault(day, []) + monsters
+    starts = pd.to_datetime(df["startdate"]).dt.date
+    stops = pd.to_datetime(df["stopdate"]).dt.date
+    monster_lists = [row.split(",") for row in df["monsters"]]
+    special_availabilities = AvailabilityIndex(list(starts), list(stops), monster_lists)
     return always_available, special_availabilities
 
 
-always_available, special_availabilities = read_availability()
-
-def read_data(
-            VALIDATE_MSM_DATE = True,
-            REMOVE_TIME_SINCE_RESET = True,
-            ASSUME_ZERO_TORCHES = True, 
-            VALIDATE_PARENTS_EXIST = True,
-            VALIDATE_RESULTS_EXIST = True,
-            CHECK_M_AIR = True,
-            verbose = False,
-            ) -> pd.DataFrame:
-    
-
-    # stops pandas skipping columns when printing (for checking the dataframe flattening works)
-    pd.set_option('display.max_columns', None)
-
-    # sanitization options
-    # VALIDATE_MSM_DATE = True  # make sure the provided date exists and is valid
-    # REMOVE_TIME_SINCE_RESET = True  # only required for analysing stuff that resets independently of the date - drops column if not required
-    # ASSUME_ZERO_TORCHES = True  # assume 0 torches if not provided, removes rows with no torch values if False
-    # VALIDATE_PARENTS_EXIST = True  # check that parents are in the list of monsters that can breed
-    # VALIDATE_RESULTS_EXIST = True  # check that results are in the list of monsters that can be bred
-
-    # master sheet details
-    SHEET_ID = "15kDI5lQL7szwh4YbjeZ6c4xRcLNpiMkXwLwfQzqGhCQ"
-    GID = "0"
-
-    # live fetch of the sheet as a csv
-    url = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={GID}"
-    if verbose:
-        print("Fetching breeding data from:", url)
-    df = pd.read_csv(url, header=0)
-    if verbose:
-        print("Breeding data fetched")
-
-    # monster breeding details
-    VALIDATION_SHEET_ID = "1jn0Pt8SH0ve0WiH8RZlL-nyQODSriUCOJQlN6yLc9_E"
-    VALIDATION_GID = "1001758888"
-    url_val = f"https://docs.google.com/spreadsheets/d/{VALIDATION_SHEET_ID}/export?format=csv&gid={VALIDATION_GID}"
-    if verbose:
-        print("Fetching validation data from:", url_val)
-    df_val = pd.read_csv(url_val, usecols=[1, 2], header=0)
-    if verbose:
-        print("Validation data fetched")
-
-    all_parent_monsters = df_val['Monsters that breed'].dropna().unique().tolist()
-    all_result_monsters = df_val['Monsters that are bred'].dropna().unique().tolist()
-    #print(all_parent_monsters)
-    #print(all_result_monsters)
-
+class RuleData:
+    """
+    Registry of all rule data (elements, special combinations, rares, groups
+    and availabilities). Every table is read from its file the first time it's used.
 
+    Parameters
+    ----------
+    data_dir: str, default "."
+        Directory containing the data files.
+    """
+    TABLES = ["elements", "reverse_elements", "specials", "existing_rares", "groups",
+              "group_dict", "always_available", "special_availabilities"]
+
+    def __init__(self, data_dir: str = "."):
+        self.data_dir = data_dir
+        self._tables = {}
+        self._reload_callbacks = []
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.data_dir, filename)
+
+    def _load(self, name: str) -> None:
+        if name in ("elements", "reverse_elements"):
+            self._tables["elements"], self._tables["reverse_elements"] = read_elements(self.data_dir)
+        elif name == "specials":
+            self._tables["specials"] = read_specials(data_dir=self.data_dir)
+        elif name == "existing_rares":
+            self._tables["existing_rares"] = read_existing_rares(self.data_dir)
+        elif name == "groups":
+            self._tables["groups"] = read_groups(self.data_dir)
+        elif name == "group_dict":
+            groups = self.groups
+            self._tables["group_dict"] = dict(zip(groups["group name"], groups["monsters"]))
+        elif name in ("always_available", "special_availabilities"):
+            self._tables["always_available"], self._tables["special_availabilities"] = read_availability(self.data_dir, self.reverse_elements)
+
+    def __getattr__(self, name: str):
+        # Only called for attributes that aren't set, i.e. the tables
+        if name not in RuleData.TABLES:
+            raise AttributeError(name)
+        if name not in self._tables:
+            self._load(name)
+        return self._tables[name]
+
+    def loaded(self) -> dict:
+        """
+        All tables that have been loaded so far.
+        """
+        return dict(self._tables)
+
+    def update(self, tables: dict) -> None:
+        """
+        Use already loaded tables (e.g. from another process) instead of reading the files.
+        """
+        self._tables.update(tables)
+
+    def on_reload(self, callback) -> None:
+        """
+        Register a function to call whenever the rule data is reloaded,
+        e.g. to clear caches built from it.
+        """
+        self._reload_callbacks.append(callback)
+
+    def reload(self, data_dir: str | None = None) -> None:
+        """
+        Forget all loaded tables, so they get read again on next use.
+
+        Parameters
+        ----------
+        data_dir: str | None, default None
+            New directory to read the data files from. If None, keeps the current one.
+        """
+        if data_dir is not None:
+            self.data_dir = data_dir
+        self._tables = {}
+        for callback in self._reload_callbacks:
+            callback()
+
+rules = RuleData()
+
+def __getattr__(name: str):
+    # Keeps filereader.elements, filereader.specials etc. working, but loaded on first use
+    if name in RuleData.TABLES:
+        return getattr(rules, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+# master sheet details
+SHEET_ID = "15kDI5lQL7szwh4YbjeZ6c4xRcLNpiMkXwLwfQzqGhCQ"
+GID = "0"
+SHEET_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={GID}"
+
+# monster breeding details
+VALIDATION_SHEET_ID = "1jn0Pt8SH0ve0WiH8RZlL-nyQODSriUCOJQlN6yLc9_E"
+VALIDATION_GID = "1001758888"
+VALIDATION_URL = f"https://docs.google.com/spreadsheets/d/{VALIDATION_SHEET_ID}/export?format=csv&gid={VALIDATION_GID}"
+
+SHEET_ROW_COLUMN = "Sheet row"
+FIRST_SHEET_ROW = 3 # Below the two header rows
+
+def flatten_columns(df: pd.DataFrame, drop_header_row: bool = True, first_sheet_row: int = FIRST_SHEET_ROW) -> pd.DataFrame:
+    """
+    Flatten the two header rows of the master sheet into single column names,
+    and drop the second header row (if it's in df, which it isn't for later chunks
+    of a chunked read).
+    A column "Sheet row" is added with the row number of every row in the master sheet,
+    counting from first_sheet_row, so rows can be traced back to the sheet after cleaning.
+    """
     # flattening nested columns
     unnamed_col_count = 0
     for col in df.columns:
@@ -273,74 +348,390 @@ def read_data(
     # renaming the old Parent 1/2 columns to Parent 1/2 Species to fit with the flattened structure
     df.rename(columns={'Parent 1': 'Parent 1 Species', 'Parent 2': 'Parent 2 Species'}, inplace=True)
     # drops the second row which is now redundant
-    df = df.drop(index=0).reset_index(drop=True)
+    if drop_header_row:
+        df = df.drop(index=0).reset_index(drop=True)
+    df[SHEET_ROW_COLUMN] = np.arange(first_sheet_row, first_sheet_row + df.shape[0], dtype=np.int32)
+    return df
 
-    # date validation
+REJECTION_COLUMN = "Rejection reason"
+
+def validate_rows(
+            df: pd.DataFrame,
+            all_parent_monsters: list,
+            all_result_monsters: list,
+            VALIDATE_MSM_DATE = True,
+            REMOVE_TIME_SINCE_RESET = True,
+            ASSUME_ZERO_TORCHES = True,
+            VALIDATE_PARENTS_EXIST = True,
+            VALIDATE_RESULTS_EXIST = True,
+            dates: pd.Series | None = None,
+            ) -> pd.Series:
+    """
+    Check all rows of the (flattened) master sheet in one pass.
+    See read_data for the cleaning options.
+    The date column can be passed as dates if it was already parsed (with errors='coerce').
+
+    Returns
+    -------
+    reasons: pd.Series
+        Why every row gets rejected (the first check it fails), None for valid rows.
+    """
+    checks = []
+    if VALIDATE_MSM_DATE:
+        if dates is None:
+            date_col = [col for col in df.columns if 'Date' in col][0]
+            dates = pd.to_datetime(df[date_col], errors='coerce')
+        checks.append((dates.isna().to_numpy(), "Invalid date"))
+    if not REMOVE_TIME_SINCE_RESET:
+        time_col = [col for col in df.columns if 'Time since reset' in col][0]
+        checks.append((pd.to_timedelta(df[time_col], errors='coerce').isna().to_numpy(), "Invalid time since reset"))
+    if not ASSUME_ZERO_TORCHES:
+        torch_col = [col for col in df.columns if 'Torches' in col][0]
+        checks.append((pd.to_numeric(df[torch_col], errors='coerce').isna().to_numpy(), "No torches"))
+    if VALIDATE_PARENTS_EXIST:
+        parent1_col = [col for col in df.columns if 'Parent 1 Species' in col][0]
+        parent2_col = [col for col in df.columns if 'Parent 2 Species' in col][0]
+        valid_parents = df[parent1_col].isin(all_parent_monsters) & df[parent2_col].isin(all_parent_monsters)
+        checks.append((~valid_parents.to_numpy(), "Invalid parent monster"))
+    if VALIDATE_RESULTS_EXIST:
+        result_col = [col for col in df.columns if 'Result Monster' in col][0]
+        checks.append((~df[result_col].isin(all_result_monsters).to_numpy(), "Invalid result monster"))
+    if not checks:
+        return pd.Series(None, index=df.index, dtype=object, name=REJECTION_COLUMN)
+    reasons = np.select([failed for failed, _ in checks], [reason for _, reason in checks], default=None)
+    return pd.Series(reasons, index=df.index, dtype=object, name=REJECTION_COLUMN)
+
+def clean_rows(
+            df: pd.DataFrame,
+            all_parent_monsters: list,
+            all_result_monsters: list,
+            VALIDATE_MSM_DATE = True,
+            REMOVE_TIME_SINCE_RESET = True,
+            ASSUME_ZERO_TORCHES = True,
+            VALIDATE_PARENTS_EXIST = True,
+            VALIDATE_RESULTS_EXIST = True,
+            CHECK_M_AIR = True,
+            verbose = False,
+            keep_rejected = False,
+            ) -> pd.DataFrame:
+    """
+    Validate and clean the rows of the (flattened) master sheet.
+    Every row is cleaned on its own, so any slice of rows can be cleaned separately.
+    See read_data for the cleaning options and keep_rejected.
+    """
+    flags = {
+        "VALIDATE_MSM_DATE": VALIDATE_MSM_DATE,
+        "REMOVE_TIME_SINCE_RESET": REMOVE_TIME_SINCE_RESET,
+        "ASSUME_ZERO_TORCHES": ASSUME_ZERO_TORCHES,
+        "VALIDATE_PARENTS_EXIST": VALIDATE_PARENTS_EXIST,
+        "VALIDATE_RESULTS_EXIST": VALIDATE_RESULTS_EXIST,
+    }
+    dates = None
     if VALIDATE_MSM_DATE:
         date_col = [col for col in df.columns if 'Date' in col][0]
         if verbose:
             print(date_col)
-        df = df[pd.to_datetime(df[date_col], errors='coerce').notna()].reset_index(drop=True)
-        df[date_col] = pd.to_datetime(df[date_col])
+        dates = pd.to_datetime(df[date_col], errors='coerce') # Parsed only once, for checking and converting
+    reasons = validate_rows(df, all_parent_monsters, all_result_monsters, dates=dates, **flags)
+    valid = reasons.isna().to_numpy()
+    if verbose and not valid.all():
+        print("Rejected rows:")
+        print(reasons[~valid].value_counts())
+        print(df[~valid])
+    if keep_rejected:
+        df = df.copy()
+        df[REJECTION_COLUMN] = reasons
+    else:
+        df = df[valid].reset_index(drop=True)
+        if dates is not None:
+            dates = dates[valid].reset_index(drop=True)
+
+    if VALIDATE_MSM_DATE:
+        df[date_col] = dates
 
-    # time since reset validation or removal
+    # time since reset removal
     if REMOVE_TIME_SINCE_RESET:
         time_col = [col for col in df.columns if 'Time since reset' in col][0]
         df = df.drop(columns=[time_col])
-    else:
-        time_col = [col for col in df.columns if 'Time since reset' in col][0]
-        df = df[pd.to_timedelta(df[time_col], errors='coerce').notna()].reset_index(drop=True)
 
-
-    # assume zero torches coercion or removal of blank torch-count entries
+    # assume zero torches coercion
     if ASSUME_ZERO_TORCHES:
         torch_col = [col for col in df.columns if 'Torches' in col][0]
         df[torch_col] = df[torch_col].fillna(0)
-    else:
-        torch_col = [col for col in df.columns if 'Torches' in col][0]
-        df = df[pd.to_numeric(df[torch_col], errors='coerce').notna()].reset_index(drop=True)
-
-    # parent monster validation
-    if VALIDATE_PARENTS_EXIST:
-        parent1_col = [col for col in df.columns if 'Parent 1 Species' in col][0]
-        parent2_col = [col for col in df.columns if 'Parent 2 Species' in col][0]
-
-        invalid_parents_df = df[~df[parent1_col].isin(all_parent_monsters) | ~df[parent2_col].isin(all_parent_monsters)]
-        if not invalid_parents_df.empty:
-            if verbose:
-                print("Invalid parent monster entries:")
-                print(invalid_parents_df)
-
-        df = df[df[parent1_col].isin(all_parent_monsters) & df[parent2_col].isin(all_parent_monsters)].reset_index(drop=True)
 
     # Make M AIr be M Air
     if CHECK_M_AIR:
         df["Island"] = df["Island"].replace("M AIr", "M Air")
-        # mask = df["Island"] == 'M AIr'
-        # df["Island", mask] = "M Air"
 
-    # result monster validation
-    if VALIDATE_RESULTS_EXIST:
-        result_col = [col for col in df.columns if 'Result Monster' in col][0]
+    return df
+
+def _match_dtypes(df: pd.DataFrame, dtypes: pd.Series) -> pd.DataFrame:
+    # Chunks are typed on their own, e.g. torches are int if a chunk has no blanks.
+    # Cast them to the types of the first chunk, if that can be done.
+    for col in df.columns:
+        if col in dtypes and df[col].dtype != dtypes[col]:
+            try:
+                df[col] = df[col].astype(dtypes[col])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+def iter_data(
+            chunksize: int = 10000,
+            VALIDATE_MSM_DATE = True,
+            REMOVE_TIME_SINCE_RESET = True,
+            ASSUME_ZERO_TORCHES = True,
+            VALIDATE_PARENTS_EXIST = True,
+            VALIDATE_RESULTS_EXIST = True,
+            CHECK_M_AIR = True,
+            verbose = False,
+            fetch = None,
+            sheet_url: str = SHEET_URL,
+            validation_url: str = VALIDATION_URL,
+            output: str | None = 'msm_data.csv',
+            ):
+    """
+    Fetch and clean the master sheet in chunks, so memory use stays bounded
+    however large the sheet gets. Every cleaned chunk is appended to output and yielded.
+    Concatenating all chunks gives the same data as read_data.
+    See read_data for the other parameters.
+
+    Parameters
+    ----------
+    chunksize: int, default 10000
+        Amount of sheet rows to read and clean at once.
 
-        invalid_results_df = df[~df[result_col].isin(all_result_monsters)]
-        if not invalid_results_df.empty:
+    output: str | None, default 'msm_data.csv'
+        CSV file to write the cleaned data to. If None, nothing is written.
+    """
+    flags = {
+        "VALIDATE_MSM_DATE": VALIDATE_MSM_DATE,
+        "REMOVE_TIME_SINCE_RESET": REMOVE_TIME_SINCE_RESET,
+        "ASSUME_ZERO_TORCHES": ASSUME_ZERO_TORCHES,
+        "VALIDATE_PARENTS_EXIST": VALIDATE_PARENTS_EXIST,
+        "VALIDATE_RESULTS_EXIST": VALIDATE_RESULTS_EXIST,
+        "CHECK_M_AIR": CHECK_M_AIR,
+    }
+    if fetch is None:
+        import fetcher # Imported here, urllib takes a while to import and isn't needed for local data
+        fetch = fetcher.default_fetcher()
+    if hasattr(fetch, "prefetch"): # Start downloading both sheets at once
+        fetch.prefetch([validation_url, sheet_url])
+    if verbose:
+        print("Fetching validation data from:", validation_url)
+    df_val = fetch(validation_url, usecols=[1, 2], header=0)
+    all_parent_monsters = df_val['Monsters that breed'].dropna().unique().tolist()
+    all_result_monsters = df_val['Monsters that are bred'].dropna().unique().tolist()
+
+    # The second header row makes pandas read the columns under it as text when reading
+    # everything at once, so later chunks have to be told to do the same
+    header_row = fetch(sheet_url, header=0, nrows=1)
+    text_columns = {col: str for col in header_row.columns if header_row[col].notna().any()}
+
+    if verbose:
+        print("Fetching breeding data in chunks from:", sheet_url)
+    first_dtypes = None
+    chunk = None
+    next_sheet_row = FIRST_SHEET_ROW
+    for i, chunk in enumerate(fetch(sheet_url, header=0, chunksize=chunksize, dtype=text_columns)):
+        # The other columns have a blank in the second header row, so they can't be bool or int
+        for col in chunk.columns:
+            if col not in text_columns:
+                if pd.api.types.is_bool_dtype(chunk[col]):
+                    chunk[col] = chunk[col].astype(object)
+                elif pd.api.types.is_integer_dtype(chunk[col]):
+                    chunk[col] = chunk[col].astype(float)
+        chunk = flatten_columns(chunk, drop_header_row = i == 0, first_sheet_row = next_sheet_row)
+        next_sheet_row += chunk.shape[0]
+        chunk = clean_rows(chunk, all_parent_monsters, all_result_monsters, verbose=verbose, **flags)
+        if chunk.empty: # Nothing left after cleaning, and its types are meaningless
+            continue
+        first = first_dtypes is None
+        if first:
+            first_dtypes = chunk.dtypes
+        else:
+            chunk = _match_dtypes(chunk, first_dtypes)
+        chunk = schema.apply_schema(chunk)
+        if output is not None:
+            chunk.to_csv(output, mode = 'w' if first else 'a', header = first, index=False)
+        yield chunk
+    if first_dtypes is None: # Every row was removed, or the sheet has no rows at all
+        if chunk is None: # Only the header rows, so no chunks: clean them to get the columns
+            chunk = flatten_columns(header_row, drop_header_row=True)
+            chunk = clean_rows(chunk, all_parent_monsters, all_result_monsters, verbose=verbose, **flags)
+        chunk = schema.apply_schema(chunk)
+        if output is not None:
+            chunk.to_csv(output, index=False)
+        yield chunk
+
+@instrument.instrumented()
+def read_data(
+            VALIDATE_MSM_DATE = True,
+            REMOVE_TIME_SINCE_RESET = True,
+            ASSUME_ZERO_TORCHES = True, 
+            VALIDATE_PARENTS_EXIST = True,
+            VALIDATE_RESULTS_EXIST = True,
+            CHECK_M_AIR = True,
+            verbose = False,
+            fetch = None,
+            sheet_url: str = SHEET_URL,
+            validation_url: str = VALIDATION_URL,
+            snapshot_path: str | None = None,
+            offline: bool = False,
+            incremental: bool = False,
+            chunksize: int | None = None,
+            keep_rejected: bool = False,
+            ) -> pd.DataFrame:
+    """
+    Fetch the master sheet and clean it.
+
+    Cleaning options
+    ----------------
+    VALIDATE_MSM_DATE: make sure the provided date exists and is valid
+    REMOVE_TIME_SINCE_RESET: only required for analysing stuff that resets independently of the date - drops column if not required
+    ASSUME_ZERO_TORCHES: assume 0 torches if not provided, removes rows with no torch values if False
+    VALIDATE_PARENTS_EXIST: check that parents are in the list of monsters that can breed
+    VALIDATE_RESULTS_EXIST: check that results are in the list of monsters that can be bred
+    CHECK_M_AIR: replace the misspelled island "M AIr" by "M Air"
+
+    Other parameters
+    ----------------
+    fetch: callable | None, default None
+        Function (url, **read_csv_kwargs) -> pd.DataFrame used to get both sheets.
+        If None, fetcher.default_fetcher() is used: both sheets are downloaded at the same time,
+        and only when they changed (see fetcher.py). Can be replaced to read local files instead,
+        or by pd.read_csv to read the urls directly.
+
+    sheet_url, validation_url: str
+        Where to get the master sheet and the validation sheet.
+
+    snapshot_path: str | None, default None
+        If given, the cleaned data is saved as a snapshot here (see snapshot.py).
+        The snapshot is used instead of cleaning again when the sheets haven't changed,
+        and when fetching fails.
+
+    offline: bool, default False
+        Don't fetch at all, only load the snapshot.
+
+    incremental: bool, default False
+        If the master sheet only got new rows appended since the snapshot,
+        only clean the new rows.
+
+    chunksize: int | None, default None
+        If given, read and clean the sheet this many rows at a time (see iter_data).
+        Can't be combined with snapshots.
+
+    keep_rejected: bool, default False
+        Keep the rows that don't pass validation, with the reason in a column
+        "Rejection reason" (None for valid rows), to check which rows get dropped and why.
+        The result isn't saved to msm_data.csv, and this can't be combined with
+        snapshots or chunked reading.
+    """
+    # stops pandas skipping columns when printing (for checking the dataframe flattening works)
+    pd.set_option('display.max_columns', None)
+
+    flags = {
+        "VALIDATE_MSM_DATE": VALIDATE_MSM_DATE,
+        "REMOVE_TIME_SINCE_RESET": REMOVE_TIME_SINCE_RESET,
+        "ASSUME_ZERO_TORCHES": ASSUME_ZERO_TORCHES,
+        "VALIDATE_PARENTS_EXIST": VALIDATE_PARENTS_EXIST,
+        "VALIDATE_RESULTS_EXIST": VALIDATE_RESULTS_EXIST,
+        "CHECK_M_AIR": CHECK_M_AIR,
+    }
+    if keep_rejected and (chunksize is not None or snapshot_path is not None or offline or incremental):
+        raise ValueError("Keeping rejected rows can't be combined with snapshots or chunked reading")
+    if chunksize is not None:
+        if snapshot_path is not None or offline or incremental:
+            raise ValueError("Chunked reading can't be combined with snapshots")
+        chunks = iter_data(chunksize, verbose=verbose, fetch=fetch, sheet_url=sheet_url, validation_url=validation_url, **flags)
+        # Chunks have their own categories, so the schema is applied again to the whole
+        return schema.apply_schema(pd.concat(list(chunks), ignore_index=True))
+
+    cached_df, metadata = None, None
+    if snapshot_path is not None:
+        cached_df, metadata = snapshot.load_snapshot(snapshot_path)
+        if metadata is not None and (metadata["flags"] != flags or SHEET_ROW_COLUMN not in cached_df.columns):
+            cached_df, metadata = None, None # Cleaned with other options (or an older version), can't be reused
+    if offline:
+        if cached_df is None:
+            raise FileNotFoundError("No usable snapshot at {}".format(snapshot_path))
+        return cached_df
+
+    # live fetch of the sheets as a csv
+    if fetch is None:
+        import fetcher # See iter_data
+        fetch = fetcher.default_fetcher()
+    try:
+        if hasattr(fetch, "prefetch"): # Start downloading both sheets at once
+            fetch.prefetch([sheet_url, validation_url])
+        if verbose:
+            print("Fetching breeding data from:", sheet_url)
+        raw_df = fetch(sheet_url, header=0)
+        if verbose:
+            print("Breeding data fetched")
+            print("Fetching validation data from:", validation_url)
+        df_val = fetch(validation_url, usecols=[1, 2], header=0)
+        if verbose:
+            print("Validation data fetched")
+    except OSError: # Includes network errors
+        if cached_df is None:
+            raise
+        if verbose:
+            print("Fetching failed, using snapshot from", metadata["fetched_at"])
+        return cached_df
+
+    source_hash = snapshot.frame_hash(raw_df)
+    validation_hash = snapshot.frame_hash(df_val)
+    if cached_df is not None and metadata["validation_hash"] == validation_hash:
+        if metadata["source_hash"] == source_hash:
             if verbose:
-                print("Invalid result monster entries:")
-                print(invalid_results_df)
+                print("Sheet unchanged since snapshot")
+            return cached_df
+        # Only the appended rows need cleaning if the rows that were cleaned before didn't change
+        appended_only = (
+            incremental
+            and 1 <= metadata["raw_rows"] <= raw_df.shape[0]
+            and snapshot.frame_hash(raw_df.iloc[:metadata["raw_rows"]]) == metadata["source_hash"]
+            )
+    else:
+        appended_only = False
 
-        df = df[df[result_col].isin(all_result_monsters)].reset_index(drop=True)
+    all_parent_monsters = df_val['Monsters that breed'].dropna().unique().tolist()
+    all_result_monsters = df_val['Monsters that are bred'].dropna().unique().tolist()
+    #print(all_parent_monsters)
+    #print(all_result_monsters)
+
+    df = flatten_columns(raw_df.copy())
+    if appended_only:
+        # Row i of the flattened sheet is row i+1 of the raw sheet
+        new_rows = df.iloc[metadata["raw_rows"] - 1:].reset_index(drop=True)
+        if verbose:
+            print("Cleaning {} new rows".format(new_rows.shape[0]))
+        new_df = clean_rows(new_rows, all_parent_monsters, all_result_monsters, verbose=verbose, **flags)
+        df = pd.concat([cached_df, new_df], ignore_index=True)
+    else:
+        df = clean_rows(df, all_parent_monsters, all_result_monsters, verbose=verbose, keep_rejected=keep_rejected, **flags)
 
     # print(df)
 
+    df = schema.apply_schema(df)
+    if keep_rejected:
+        return df
     df.to_csv('msm_data.csv', index=False)
+    if snapshot_path is not None:
+        snapshot.save_snapshot(df, {
+            "source_hash": source_hash,
+            "validation_hash": validation_hash,
+            "raw_rows": raw_df.shape[0],
+            "flags": flags,
+            }, snapshot_path)
     return df
 
 def read_from_csv():
     df = pd.read_csv("msm_data.csv")
     df["Date (MSM time) (MM/DD/YYYY)"] = pd.to_datetime(df["Date (MSM time) (MM/DD/YYYY)"])
     df["Torches Lit"] = pd.to_numeric(df["Torches Lit"])
-    return df
+    return schema.apply_schema(df)
 
 if __name__ == "__main__":
     df = read_data()
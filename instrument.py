@@ -0,0 +1,154 @@
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+import pandas as pd
+# Timing and row counts of the pipeline steps.
+# Disabled by default: instrumented functions then only pay for one extra function call.
+# When enabled, every step records an event (a dict), which is kept in memory
+# and optionally appended to a JSON lines log.
+
+_enabled = False
+_memory = False
+_log_path = None
+_events = []
+_running = [] # Events of the steps that are running right now, innermost last
+
+def enable(log_path: str | None = None, memory: bool = False) -> None:
+    """
+    Start recording events.
+
+    Parameters
+    ----------
+    log_path: str | None, default None
+        If given, every event is also appended to this file as one line of JSON.
+
+    memory: bool, default False
+        Also record memory use (with tracemalloc, which makes everything quite a bit slower).
+    """
+    global _enabled, _memory, _log_path
+    _enabled = True
+    _memory = memory
+    _log_path = log_path
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable() -> None:
+    """
+    Stop recording events. Events recorded so far are kept.
+    """
+    global _enabled, _memory
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _enabled = False
+    _memory = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def events() -> list:
+    """
+    All events recorded so far, in the order the steps finished.
+    """
+    return list(_events)
+
+def clear() -> None:
+    _events.clear()
+
+@contextlib.contextmanager
+def collect(memory: bool = False):
+    """
+    Record events only within a with block, e.g.
+
+        with instrument.collect() as events:
+            df = filereader.read_data()
+        print(events)
+    """
+    global _memory
+    was_enabled, had_memory = _enabled, _memory
+    start = len(_events)
+    collected = []
+    enable(_log_path, memory or _memory)
+    try:
+        yield collected
+    finally:
+        collected.extend(_events[start:])
+        if not was_enabled:
+            disable()
+        elif _memory and not had_memory:
+            tracemalloc.stop()
+            _memory = False
+
+def _rows(value) -> int | None:
+    if isinstance(value, tuple) and len(value) > 0: # e.g. (subset, counts): the first is the data
+        value = value[0]
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    return None
+
+def _emit(event: dict) -> None:
+    _events.append(event)
+    if _log_path is not None:
+        with open(_log_path, "a") as f:
+            f.write(json.dumps(event, default=str) + "\n")
+
+@contextlib.contextmanager
+def step(name: str, rows_in: int | None = None):
+    """
+    Record one step of the pipeline. The event is yielded, so rows_out or other
+    information can be filled in within the with block. Yields None when disabled.
+    """
+    if not _enabled:
+        yield None
+        return
+    event = {"step": name, "started": time.time(), "rows_in": rows_in, "rows_out": None}
+    if _memory:
+        # Steps within this step reset the peak too, so the peak of an outer step can be too low
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+    _running.append(event)
+    start = time.perf_counter()
+    try:
+        yield event
+    finally:
+        event["seconds"] = time.perf_counter() - start
+        _running.remove(event)
+        if _memory:
+            memory_after, peak = tracemalloc.get_traced_memory()
+            event["memory_delta_mb"] = (memory_after - memory_before) / 1e6
+            event["peak_mb"] = (peak - memory_before) / 1e6
+        _emit(event)
+
+def instrumented(name: str | None = None):
+    """
+    Decorator recording a step every time the function is called.
+    Rows in is the length of the first dataframe argument, rows out the length
+    of the dataframe that is returned (the first one, if a tuple is returned).
+
+    Parameters
+    ----------
+    name: str | None, default None
+        Name of the step, the name of the function if None.
+    """
+    def decorator(function):
+        step_name = name or function.__name__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            rows_in = next((_rows(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+            with step(step_name, rows_in) as event:
+                output = function(*args, **kwargs)
+                event["rows_out"] = _rows(output)
+            return output
+        return wrapper
+    return decorator
+
+def annotate(**info) -> None:
+    """
+    Add information to the event of the innermost running step, e.g. the amount of
+    torches constant_torches picked. Does nothing if disabled or outside of a step.
+    """
+    if _enabled and _running:
+        _running[-1].update(info)
@@ -3,12 +3,13 @@ import breeder
 import pandas as pd
 import slicer
 import analysis
+import export
 
 df = filereader.read_data()
 # df = filereader.read_from_csv()
 breeder.add_possible_results_to_df(df)
-# df["Possible results"].to_excel("possible_results.xlsx")
-# df["Possible results"].to_csv("possible_results.csv")
+export.export_possible_results(df, "possible_results.csv")
+# export.export_possible_results(df, "possible_results.xlsx") # or layout="wide", or .parquet
 
 # print(slicer.look_for_outcome_group(df, ["Epic Yelmut", "Epic Edamimi"]))
 target = ["Rare Maw", "Rare Drumpler", "Rare Fwog"]
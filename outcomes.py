@@ -0,0 +1,115 @@
+import itertools
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from vocabulary import MonsterVocabulary, build_vocabulary
+# Compact storage of the possible results of many breeding attempts:
+# a sparse boolean matrix with one row per attempt and one column per monster.
+
+class OutcomeMatrix:
+    """
+    Possible results of breeding attempts as a sparse row x monster matrix.
+
+    Parameters
+    ----------
+    matrix: sparse.csr_matrix
+        Boolean matrix, True where the monster (column) is a possible result
+        of the attempt (row).
+
+    vocabulary: MonsterVocabulary
+        Monster names of the columns.
+
+    index: pd.Index
+        Index labels of the attempts, usually the index of the breeding dataframe.
+    """
+    def __init__(self, matrix: sparse.csr_matrix, vocabulary: MonsterVocabulary, index: pd.Index):
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.index = index
+
+    @classmethod
+    def from_results(cls, possible_results, vocabulary: MonsterVocabulary | None = None, index: pd.Index | None = None):
+        """
+        Build the matrix from lists of possible results, like the "Possible results" column.
+        Monsters missing from the vocabulary are added to it.
+        """
+        if vocabulary is None:
+            vocabulary = build_vocabulary()
+        if index is None:
+            index = possible_results.index if isinstance(possible_results, pd.Series) else pd.RangeIndex(len(possible_results))
+        lengths = np.fromiter((len(results) for results in possible_results), dtype=np.int64, count=len(possible_results))
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        columns = np.fromiter((vocabulary.add(monster) for monster in itertools.chain.from_iterable(possible_results)), dtype=np.int32, count=indptr[-1])
+        matrix = sparse.csr_matrix((np.ones(len(columns), dtype=bool), columns, indptr), shape=(len(lengths), len(vocabulary)))
+        matrix.sum_duplicates()
+        return cls(matrix, vocabulary, index)
+
+    def _columns(self, monsters) -> np.ndarray:
+        if isinstance(monsters, str):
+            monsters = [monsters]
+        return self.vocabulary.ids_of(monsters)
+
+    def _aligned(self) -> sparse.csr_matrix:
+        # Monsters can be added to the vocabulary after building the matrix
+        if self.matrix.shape[1] < len(self.vocabulary):
+            self.matrix.resize((self.matrix.shape[0], len(self.vocabulary)))
+        return self.matrix
+
+    def mask(self, monsters) -> np.ndarray:
+        """
+        Boolean array, True for attempts that could have resulted in any of the monsters.
+        """
+        indicator = np.zeros(len(self.vocabulary), dtype=np.int32)
+        indicator[self._columns(monsters)] = 1
+        return self._aligned() @ indicator > 0
+
+    def counts(self) -> pd.Series:
+        """
+        For every monster, the amount of attempts that could have resulted in it.
+        """
+        counts = np.bincount(self.matrix.indices, minlength=len(self.vocabulary))
+        return pd.Series(counts, index=self.vocabulary.monsters, name="attempts")
+
+    def group_counts(self, groups) -> pd.DataFrame:
+        """
+        For every group of attempts and every monster, the amount of attempts
+        that could have resulted in that monster.
+
+        Parameters
+        ----------
+        groups: array-like
+            Group label of every attempt, e.g. the "Torches Lit" column.
+
+        Returns
+        -------
+        counts: pd.DataFrame
+            One row per group, one column per monster that occurs at all.
+        """
+        codes, labels = pd.factorize(np.asarray(groups), sort=True)
+        membership = sparse.csr_matrix((np.ones(len(codes), dtype=np.int64), (codes, np.arange(len(codes)))), shape=(len(labels), len(codes)))
+        counts = (membership @ self._aligned().astype(np.int64)).toarray()
+        present = counts.sum(axis=0) > 0
+        return pd.DataFrame(counts[:, present], index=labels, columns=np.array(self.vocabulary.monsters, dtype=object)[present])
+
+    def subset(self, mask) -> "OutcomeMatrix":
+        """
+        Keep only the attempts where mask is True.
+        """
+        mask = np.asarray(mask)
+        return OutcomeMatrix(self._aligned()[mask], self.vocabulary, self.index[mask])
+
+    def to_lists(self) -> list:
+        """
+        Convert back to one list of possible results per attempt.
+        Results are in vocabulary order, not in the order they were added.
+        """
+        monsters = self.vocabulary.monsters
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        return [[monsters[i] for i in indices[start:stop]] for start, stop in zip(indptr[:-1], indptr[1:])]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import pickle
+import filereader
+# Precomputed breeding outcomes for every parent pair, per island.
+# Outcomes only depend on the rule files, so the table is saved to disk together
+# with a hash of those files, and only gets rebuilt when one of them changes.
+
+SOURCE_FILES = ["elements.txt", "specials.txt", "existing_rares.txt"]
+TABLE_FILE = "outcome_table.pkl"
+TABLE_VERSION = 1 # Bump this when the breeding rules in breeder.py change
+
+def source_hash(files: list = SOURCE_FILES) -> str:
+    """
+    Hash of the contents of the rule files the outcome table is built from.
+    """
+    digest = hashlib.sha256(str(TABLE_VERSION).encode())
+    for file in files:
+        with open(filereader.rules.path(file), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def table_parents() -> list:
+    """
+    All monsters that can be a parent in a known breeding rule.
+    """
+    parents = set(filereader.elements)
+    for parent1, parent2 in filereader.specials:
+        parents.update((parent1, parent2))
+    return sorted(parents)
+
+def build_table(compute, parents: list, islands: list) -> dict:
+    """
+    Compute the outcome of every combination of parents.
+
+    Parameters
+    ----------
+    compute: callable
+        Function (parent1, parent2, island) -> list of outcomes.
+
+    parents: list
+        Common parent names.
+
+    islands: list
+        Islands on which outcomes can differ from those on any other island.
+
+    Returns
+    -------
+    table: dict
+        Keys are (parent1, parent2, None) for the outcome on an ordinary island,
+        and (parent1, parent2, island) for islands where the outcome is different.
+        Values are tuples of outcomes.
+        Parent combinations that don't exist (element combinations without a monster)
+        are left out.
+    """
+    table = {}
+    for parent1 in parents:
+        for parent2 in parents:
+            try:
+                default = tuple(compute(parent1, parent2, ""))
+            except KeyError: # No monster with this combination of elements
+                continue
+            table[(parent1, parent2, None)] = default
+            for island in islands:
+                outcomes = tuple(compute(parent1, parent2, island))
+                if outcomes != default:
+                    table[(parent1, parent2, island)] = outcomes
+    return table
+
+class OutcomeTable:
+    """
+    Lookup table of breeding outcomes, before any availability is taken into account.
+    The table is loaded from (or built and saved to) path on first use.
+
+    Parameters
+    ----------
+    compute: callable
+        Function (parent1, parent2, island) -> list of outcomes. Used to build the table
+        and for parents that aren't in it.
+
+    islands: list
+        Islands on which outcomes can differ from those on any other island.
+
+    path: str | None, default TABLE_FILE
+        Where to save the table. If None, the table is rebuilt every time.
+    """
+    def __init__(self, compute, islands: list, path: str | None = TABLE_FILE):
+        self.compute = compute
+        self.islands = islands
+        self.path = path
+        self._table = None
+
+    @property
+    def table(self) -> dict:
+        if self._table is None:
+            self.load()
+        return self._table
+
+    def reset(self) -> None:
+        """
+        Forget the loaded table, so it gets loaded again on next use.
+        """
+        self._table = None
+
+    def load(self) -> None:
+        """
+        Load the table from disk if it was built from the current rule files,
+        otherwise build it and save it.
+        """
+        current_hash = source_hash()
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+            if saved["hash"] == current_hash:
+                self._table = saved["table"]
+                return
+        self._table = build_table(self.compute, table_parents(), self.islands)
+        if self.path is not None:
+            with open(self.path, "wb") as f:
+                pickle.dump({"hash": current_hash, "table": self._table}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def lookup(self, parent1: str, parent2: str, island: str) -> tuple:
+        """
+        Get the outcomes of breeding two (common) parents on an island.
+        """
+        table = self.table
+        outcomes = table.get((parent1, parent2, island))
+        if outcomes is None:
+            outcomes = table.get((parent1, parent2, None))
+            if outcomes is None: # Parents without any known rule
+                outcomes = tuple(self.compute(parent1, parent2, island))
+                table[(parent1, parent2, island)] = outcomes
+        return outcomes
@@ -0,0 +1,225 @@
+import os
+import pandas as pd
+import filereader
+# The original, straightforward implementation of the breeding rules, kept as it was
+# so faster implementations can be checked against it (see differential.py).
+# Don't optimize anything in here: being obviously right is the whole point.
+# The rule files are read through filereader.rules, except for the availabilities,
+# which are read the original way (a list of monsters for every single day).
+
+rules = filereader.rules
+
+ethereal_pairo={
+    "Plant":"Ghazt",
+    "Cold":"Grumpyre",
+    "Air":"Reebro",
+    "Water":"Jeeode",
+    "Earth":"Humbug",
+    # "Light":"How's the future?",
+    "Psychic":"Hairionette",
+    "Faerie":"Owlesque",
+    "Bone":"Arcorina"
+}
+
+natural_singles = ["Noggin", "Toe Jammer", "Mammott", "Potbelly", "Tweedle"]
+ethereal_elements = ["Pl", "Sh", "Me", "Cr", "Po"]
+
+def attempt_results(parent1, parent2, island, date, day, night):
+    """
+    Same as breeder.attempt_results.
+    """
+    always_available, special_availabilities = availabilities()
+    pairos = filereader.get_group("Paironormals")
+    parent1 = derare(parent1)
+    parent2 = derare(parent2)
+    demirrored = demirror(island)
+
+    basic_results = basic_breeding(parent1, parent2)
+    special_results = special_breeding(parent1, parent2, demirrored)
+    total_results = basic_results + special_results
+    rareified_results = rareify(total_results, island == "Shugabush")
+    # Apply availability filter
+    available_results = []
+    for result in rareified_results:
+        if result in always_available[demirrored]: # Always available monsters
+            available_results.append(result)
+        elif result in pairos:
+            if island [0:2] == "M " and night is True: # Minor form
+                available_results.append(result)
+            elif island[0:2] != "M " and day is True: # Major form
+                available_results.append(result)
+        elif date in special_availabilities: # Event availabilities
+            if result in special_availabilities[date]:
+                available_results.append(result)
+    return available_results
+
+def derare(monster):
+    """
+    Make a monster the common version.
+    """
+    if monster[:5] == "Rare ":
+        return monster[5:]
+    else:
+        return monster
+
+def demirror(island):
+    if island[:2] == "M ":
+        return island[2:]
+    else:
+        return island
+
+def rareify(monsters, shugabush = False):
+    """
+    Add the rare version to a list of one or more monsters, if it exists.
+    Won't add the common version if a rare is supplied.
+    Usually doesn't add the rare version of natural, fire or magical singles,
+    except for when input parameter shugabush is set to True.
+    """
+    extended_rares = rules.existing_rares.copy()
+    if shugabush: # Only on Shugabush Island can getting a Mammott or Potbelly result in its rare form
+        extended_rares = extended_rares + natural_singles
+    new_monsters = []
+    if type(monsters) is str: # If just one monster
+        if monsters in extended_rares:
+            new_monsters = [monsters, "Rare "+monsters]
+        else:
+            new_monsters = [monsters]
+    else: # If a list of monsters
+        for monster in monsters:
+            new_monsters.append(monster)
+            if monster in extended_rares:
+                new_monsters.append("Rare "+monster)
+
+    return new_monsters
+
+def basic_breeding(parent1, parent2):
+    """
+    'Regular' breeding mechanics involving elements.
+    Uses the elements of the incoming monsters to determine the outcome.
+    """
+    elements = rules.elements
+    reverse_elements = rules.reverse_elements
+    # See if both parents have registered elements
+    if parent1 in elements and parent2 in elements:
+        els1 = elements[parent1]
+        els2 = elements[parent2]
+        # Rare singles
+        if len(els1) == 3 and len(els2) == 3:
+            shared_elements = []
+            for element in els1:
+                if element in els2:
+                    shared_elements.append(element)
+            rare_singles = ["Rare "+reverse_elements[(element, )] for element in shared_elements]
+            return [parent1, parent2] + rare_singles
+        else:
+            # Check if no shared elements
+            for element in els1:
+                if element in els2:
+                    return [parent1, parent2]
+            for element in els2:
+                if element in els1:
+                    return [parent1, parent2]
+
+            # Produce new results
+            if els1[0] in ethereal_elements: # Ethereal Island also doesn't breed anything over 2 elements
+                if len(els1 + els2) >= 3:
+                    return [parent1, parent2]
+            new_monster = reverse_elements[tuple(sorted(els1+els2))]
+            if parent1 in natural_singles and parent2 in natural_singles:
+                return [new_monster] # If parents are two natural singles: only return double
+            else:
+                return [parent1, parent2, new_monster]
+    return [parent1, parent2] # Fallback if parents don't have registered elements
+
+def special_breeding(parent1, parent2, island):
+    """
+    'Special' breeding mechanics that don't involve elements.
+    Same as breeder.special_breeding.
+    """
+    specials = rules.specials
+    elements = rules.elements
+    # Just get most of them out of the dict
+    special_result = []
+    if (parent1, parent2) in specials:
+        special_result = specials[(parent1, parent2)]
+    # Ethereals + Paironormals get special treatment
+    if parent1 in elements and parent2 in elements:
+        if (len(elements[parent1]) == 3 and len(elements[parent2]) == 4) or (len(elements[parent1]) == 4 and len(elements[parent2]) == 3):
+            if island in ethereal_pairo:
+                eth = ethereal_pairo[island]
+                special_result = special_result + [eth]
+    return special_result
+
+def read_availability(data_dir: str = ".", reverse_elements: dict | None = None):
+    """
+    Same as filereader.read_availability, but with the event availabilities
+    as a dict with a list of monsters for every day.
+    """
+    if reverse_elements is None:
+        _, reverse_elements = filereader.read_elements(data_dir)
+    always_available = {}
+    with open(os.path.join(data_dir, "always_available.txt")) as f:
+        commented_lines = f.readlines()
+    lines = filereader.remove_comments(commented_lines)
+    for line in lines:
+        line = line.rstrip('\n')
+        island, monsters = line.split('~')
+        monster_list = monsters.split(',')
+        # Some monsters are defined as elements
+        elements = []
+        for monster in monster_list:
+            if len(monster) == 1 or len(monster) == 2:
+                elements.append(monster)
+        for element in elements:
+            monster_list.remove(element)
+        # Get the monsters from the elements
+        if len(elements) >= 1:
+            element_combinations = filereader.build_monster_list(elements)
+            element_combinations.remove([])
+            if island == "Ethereal":
+                new_element_combinations = []
+                for combination in element_combinations:
+                    if len(combination) <= 2:
+                        new_element_combinations.append(combination)
+                element_combinations = new_element_combinations
+            element_monsters = [reverse_elements[tuple(sorted(comb))] for comb in element_combinations]
+            always_available[island] = monster_list + element_monsters
+        else:
+            always_available[island] = monster_list
+
+    special_availabilities = {}
+    df = pd.read_csv(os.path.join(data_dir, "availabilities.csv"))
+    # Get from file: start date, stop date, list of monsters
+    df["startdate"] = pd.to_datetime(df["startdate"])
+    df["stopdate"] = pd.to_datetime(df["stopdate"])
+    monster_lists = []
+    for row in df['monsters']:
+        monster_lists.append(row.split(","))
+    df["monsters"] = monster_lists
+    # Get in dict: day, all available monsters
+    records = []
+    for _, row in df.iterrows():
+        days = pd.date_range(row["startdate"], row["stopdate"], freq='D', inclusive='left')
+        for day in days:
+            records.append((day.date(), row["monsters"]))
+
+    for day, monsters in records:
+        special_availabilities[day] = special_availabilities.setdefault(day, []) + monsters
+    return always_available, special_availabilities
+
+_availabilities = None
+
+def availabilities() -> tuple:
+    """
+    Output of read_availability for the rule directory, read on first use.
+    """
+    global _availabilities
+    if _availabilities is None:
+        _availabilities = read_availability(rules.data_dir, rules.reverse_elements)
+    return _availabilities
+
+def _reset_availabilities() -> None:
+    global _availabilities
+    _availabilities = None
+
+rules.on_reload(_reset_availabilities)
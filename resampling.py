@@ -0,0 +1,198 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import slicer
+# Resampling estimates for the chance of success, for when attempts aren't independent:
+# e.g. attempts on the same island (or by the same person) tend to be alike.
+# Resamples are drawn as whole arrays at once, a block of resamples at a time.
+
+MAX_BLOCK_CELLS = 10_000_000 # Largest resamples x clusters array to draw at once
+
+def successes(df: pd.DataFrame, success: str | list) -> np.ndarray:
+    """
+    Boolean array, True for attempts that resulted in one of the monsters.
+    If success is a string, it's interpreted as a monster group alias.
+    """
+    if type(success) is str:
+        success = slicer.alias_parser(success)
+    return df["Result Monster"].isin(success).to_numpy()
+
+def has_rare_parent(df: pd.DataFrame) -> np.ndarray:
+    """
+    Boolean array, True for attempts with at least one rare parent.
+    """
+    rare1 = df["Parent 1 Species"].astype(object).str.startswith("Rare ", na=False)
+    rare2 = df["Parent 2 Species"].astype(object).str.startswith("Rare ", na=False)
+    return (rare1 | rare2).to_numpy()
+
+def _cluster_counts(success: np.ndarray, clusters) -> tuple:
+    # Successes and attempts per cluster
+    codes, _ = pd.factorize(np.asarray(clusters), use_na_sentinel=False)
+    return np.bincount(codes, weights=success).astype(np.int64), np.bincount(codes).astype(np.int64)
+
+def _blocks(n_resamples: int, n_clusters: int, seed) -> list:
+    # Split the resamples into blocks that fit in memory, each with its own random stream
+    block_size = max(1, min(n_resamples, MAX_BLOCK_CELLS // max(n_clusters, 1)))
+    sizes = [min(block_size, n_resamples - start) for start in range(0, n_resamples, block_size)]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+def _run_blocks(function, blocks: list, args: tuple, workers: int | None) -> np.ndarray:
+    if workers is None or workers <= 1 or len(blocks) == 1:
+        return np.concatenate([function(size, seed, *args) for size, seed in blocks])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, size, seed, *args) for size, seed in blocks]
+        return np.concatenate([future.result() for future in futures])
+
+def _bootstrap_block(size: int, seed, k: np.ndarray, n: np.ndarray) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(k), size=(size, len(k))) # Clusters drawn with replacement
+    total_n = n[picks].sum(axis=1)
+    return k[picks].sum(axis=1) / np.maximum(total_n, 1)
+
+def cluster_bootstrap(
+        df: pd.DataFrame,
+        success: str | list,
+        clusters: str | None = None,
+        n_resamples: int = 10000,
+        confidence: float = 0.95,
+        seed: int | None = None,
+        workers: int | None = None,
+        ) -> dict:
+    """
+    Bootstrap confidence interval for the chance of success, resampling whole clusters of attempts.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Attempts to use, e.g. a subset from slicer.look_for_outcome_group.
+
+    success: str | list
+        Monsters that are considered a successful result. If string, interpreted as a monster group alias.
+
+    clusters: str | None, default None
+        Column with the cluster of every attempt, e.g. "Island". If None, every attempt
+        is its own cluster.
+
+    n_resamples: int, default 10000
+        Amount of bootstrap resamples.
+
+    confidence: float, default 0.95
+        confidence% interval to give (percentile interval).
+
+    seed: int | None, default None
+        Seed for the random number generator, for reproducible results.
+
+    workers: int | None, default None
+        Spread the resamples over this many processes.
+
+    Returns
+    -------
+    result: dict
+        "estimate" (successes / attempts), "lower", "upper", "std_error",
+        "clusters" and "n_resamples".
+    """
+    hits = successes(df, success)
+    if clusters is None:
+        # Every attempt its own cluster: the successes in a resample are binomial
+        n = len(hits)
+        estimate = hits.mean() if n else np.nan
+        rng = np.random.default_rng(seed)
+        rates = rng.binomial(n, estimate, size=n_resamples) / n if n else np.full(n_resamples, np.nan)
+        n_clusters = n
+    else:
+        k, n = _cluster_counts(hits, df[clusters])
+        if n.sum():
+            estimate = k.sum() / n.sum()
+            rates = _run_blocks(_bootstrap_block, _blocks(n_resamples, len(k), seed), (k, n), workers)
+        else: # No attempts, so no interval either (like without clusters)
+            estimate = np.nan
+            rates = np.full(n_resamples, np.nan)
+        n_clusters = len(k)
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(rates, [alpha, 1 - alpha])
+    return {
+        "estimate": float(estimate),
+        "lower": float(lower),
+        "upper": float(upper),
+        "std_error": float(np.std(rates, ddof=1)),
+        "clusters": n_clusters,
+        "n_resamples": n_resamples,
+    }
+
+def _permutation_block(size: int, seed, k: np.ndarray, n: np.ndarray, n_group: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # The first n_group clusters of every shuffled order get the first group label
+    order = rng.random((size, len(k))).argsort(axis=1)
+    first = order[:, :n_group]
+    rest = order[:, n_group:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return k[first].sum(axis=1) / n[first].sum(axis=1) - k[rest].sum(axis=1) / n[rest].sum(axis=1)
+
+def permutation_test(
+        df: pd.DataFrame,
+        success: str | list,
+        groups,
+        clusters: str | None = None,
+        n_resamples: int = 10000,
+        seed: int | None = None,
+        workers: int | None = None,
+        ) -> dict:
+    """
+    Permutation test for a difference in the chance of success between two groups of attempts,
+    e.g. rare vs. common parents (groups=has_rare_parent(df)) or 0 vs. 10 torches.
+
+    Parameters
+    ----------
+    df, success, n_resamples, seed, workers:
+        See cluster_bootstrap.
+
+    groups: str | array-like
+        Column name or array with the group of every attempt. Needs exactly two distinct values.
+
+    clusters: str | None, default None
+        Column with the cluster of every attempt. If given, group labels are shuffled between
+        whole clusters, so every cluster has to be in a single group. If None, every attempt
+        is shuffled on its own.
+
+    Returns
+    -------
+    result: dict
+        "groups" (the two group values, sorted), "rates" (chance of success of both),
+        "difference" (first rate minus second), "p_value" (two-sided) and "n_resamples".
+    """
+    hits = successes(df, success)
+    labels = df[groups].to_numpy() if isinstance(groups, str) else np.asarray(groups)
+    codes, values = pd.factorize(labels, sort=True)
+    if len(values) != 2 or (codes < 0).any():
+        raise ValueError("Permutation test needs exactly two groups, got {}".format(list(values)))
+    in_first = codes == 0
+    rates = [hits[in_first].mean(), hits[~in_first].mean()]
+    observed = rates[0] - rates[1]
+
+    if clusters is None:
+        # Shuffling single attempts: the successes that end up in the first group are hypergeometric
+        rng = np.random.default_rng(seed)
+        n_first, n_total, k_total = int(in_first.sum()), len(hits), int(hits.sum())
+        k_first = rng.hypergeometric(k_total, n_total - k_total, n_first, size=n_resamples)
+        differences = k_first / n_first - (k_total - k_first) / (n_total - n_first)
+    else:
+        cluster_codes, _ = pd.factorize(df[clusters].to_numpy(), use_na_sentinel=False)
+        cluster_groups = pd.DataFrame({"cluster": cluster_codes, "group": codes}).drop_duplicates()
+        if cluster_groups["cluster"].duplicated().any():
+            raise ValueError("Every cluster has to be in a single group for a clustered permutation test")
+        # Clusters of the first group first, so it's the first n_group clusters in the original order
+        first_clusters = np.sort(cluster_groups.loc[cluster_groups["group"] == 0, "cluster"].to_numpy())
+        k, n = _cluster_counts(hits, cluster_codes)
+        order = np.concatenate([first_clusters, np.setdiff1d(np.arange(len(k)), first_clusters)])
+        k, n = k[order], n[order]
+        blocks = _blocks(n_resamples, len(k), seed)
+        differences = _run_blocks(_permutation_block, blocks, (k, n, len(first_clusters)), workers)
+
+    extreme = np.sum(np.abs(differences) >= abs(observed) - 1e-12)
+    return {
+        "groups": np.asarray(values).tolist(),
+        "rates": [float(rate) for rate in rates],
+        "difference": float(observed),
+        "p_value": float((extreme + 1) / (n_resamples + 1)),
+        "n_resamples": n_resamples,
+    }
@@ -0,0 +1,95 @@
+import os
+import pickle
+import filereader
+import outcometable
+# Possible results of breeding attempts that were computed before, saved to disk.
+# The master sheet mostly gets rows appended, so on a new run only the attempts
+# that weren't seen before need computing. Everything is thrown away when one of
+# the rule files changes, also when the rules are reloaded while the cache is in use.
+
+SOURCE_FILES = ["elements.txt", "specials.txt", "existing_rares.txt", "availabilities.csv", "always_available.txt", "groups.csv"]
+CACHE_FILE = "possible_results_cache.pkl"
+
+class ResultCache:
+    """
+    Possible results per attempt key (parent1, parent2, island, date, day, night),
+    see breeder.attempt_keys.
+
+    Parameters
+    ----------
+    path: str | None, default CACHE_FILE
+        Where to save the cache. If None, it's only kept in memory.
+    """
+    def __init__(self, path: str | None = CACHE_FILE):
+        self.path = path
+        self._results = None
+        self._hash = None
+        self.changed = False
+        filereader.rules.on_reload(self._rules_reloaded)
+
+    @property
+    def results(self) -> dict:
+        if self._results is None:
+            self.load()
+        return self._results
+
+    def load(self) -> None:
+        """
+        Load the saved results, unless the rule files changed since they were computed.
+        """
+        self._hash = outcometable.source_hash(SOURCE_FILES)
+        self._results = {}
+        self.changed = False
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+            if saved["hash"] == self._hash:
+                self._results = saved["results"]
+
+    def reset(self) -> None:
+        """
+        Forget the loaded results, so they get loaded again (and checked against the rule files) on next use.
+        """
+        self._results = None
+        self.changed = False
+
+    def _rules_reloaded(self) -> None:
+        # Results computed with other rule files can't be used anymore
+        if self._results is None:
+            return
+        try:
+            outdated = outcometable.source_hash(SOURCE_FILES) != self._hash
+        except OSError: # Rule files missing from the new directory
+            outdated = True
+        if outdated:
+            self.reset()
+
+    def missing(self, keys: list) -> list:
+        """
+        Positions of the keys that aren't in the cache yet.
+        """
+        results = self.results
+        return [i for i, key in enumerate(keys) if key not in results]
+
+    def get(self, keys: list) -> list:
+        results = self.results
+        return [list(results[key]) for key in keys]
+
+    def update(self, keys: list, new_results: list) -> None:
+        results = self.results
+        for key, key_results in zip(keys, new_results):
+            results[key] = tuple(key_results)
+        self.changed = self.changed or len(keys) > 0
+
+    def save(self) -> None:
+        """
+        Write the results to disk, if anything was added since loading them.
+        """
+        if self.path is None or not self.changed:
+            return
+        with open(self.path, "wb") as f:
+            pickle.dump({"hash": self._hash, "results": self._results}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.changed = False
+
+    def __len__(self) -> int:
+        return len(self.results)
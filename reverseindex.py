@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+from availability import AvailabilityIndex
+# Breeding rules the other way around: for a result monster, which parent pairs
+# on which islands and when can give it.
+# Built from the outcome table, so it follows the same rules as breeder.possible_results.
+
+class ReverseIndex:
+    """
+    Index from result monster to the parent pairs and islands that can produce it.
+
+    Parameters
+    ----------
+    table: dict
+        Outcome table (see outcometable.build_table).
+
+    islands: list
+        All island names, including the mirror islands.
+
+    always_available: dict
+        Keys are islands (not mirrored), values are monsters that can always be bred there.
+
+    special_availabilities: AvailabilityIndex
+        When monsters are available through events.
+
+    pairos: list
+        Paironormals: major form (day) on normal islands, minor form (night) on mirror islands.
+    """
+    def __init__(self, table: dict, islands: list, always_available: dict, special_availabilities: AvailabilityIndex, pairos: list):
+        self.islands = list(islands)
+        self.always_available = always_available
+        self.special_availabilities = special_availabilities
+        self.pairos = set(pairos)
+
+        defaults = {}
+        overrides = {}
+        for (parent1, parent2, island), outcomes in table.items():
+            if island is None:
+                defaults[(parent1, parent2)] = outcomes
+            else:
+                overrides.setdefault((parent1, parent2), {})[island] = outcomes
+        self.parent_pairs = frozenset(defaults)
+
+        # Per result: (parent1, parent2) -> islands, None meaning all islands
+        self._sources = {}
+        for pair, outcomes in defaults.items():
+            pair_overrides = overrides.get(pair, {})
+            for result in set(outcomes):
+                missing = {island for island, island_outcomes in pair_overrides.items() if result not in island_outcomes}
+                islands = None if not missing else frozenset(island for island in self.islands if island not in missing)
+                self._sources.setdefault(result, {})[pair] = islands
+            for island, island_outcomes in pair_overrides.items():
+                for result in set(island_outcomes) - set(outcomes):
+                    sources = self._sources.setdefault(result, {})
+                    sources[pair] = (sources.get(pair) or frozenset()) | {island}
+
+    def results(self) -> list:
+        """
+        All monsters that can result from any known parent pair.
+        """
+        return sorted(self._sources)
+
+    def pairs(self, monsters) -> set:
+        """
+        All (common) parent pairs that can give any of the monsters on some island.
+        """
+        if isinstance(monsters, str):
+            monsters = [monsters]
+        pairs = set()
+        for monster in monsters:
+            pairs.update(self._sources.get(monster, {}))
+        return pairs
+
+    def availability(self, monster: str, island: str) -> tuple:
+        """
+        When a monster can be bred on an island, following the same rules as breeder.attempt_results.
+
+        Returns
+        -------
+        availability: str | None
+            "always", "day" or "night" (paironormal forms), "event", or None if never.
+
+        windows: list
+            (start, stop) dates of the events, for "event".
+        """
+        demirrored = island[2:] if island[:2] == "M " else island
+        if monster in self.always_available.get(demirrored, ()):
+            return "always", []
+        if monster in self.pairos:
+            return ("night" if island[:2] == "M " else "day"), []
+        windows = self.special_availabilities.windows(monster)
+        if windows:
+            return "event", windows
+        return None, []
+
+    def combinations(self, monster: str) -> pd.DataFrame:
+        """
+        Every parent pair and island that can produce a monster, with when it's available.
+        Islands where the monster can never be available are left out.
+
+        Returns
+        -------
+        combinations: pd.DataFrame
+            Columns "Parent 1 Species", "Parent 2 Species", "Island",
+            "Availability" and "Windows" (see availability).
+        """
+        availabilities = {island: self.availability(monster, island) for island in self.islands}
+        rows = []
+        for (parent1, parent2), islands in sorted(self._sources.get(monster, {}).items()):
+            for island in self.islands if islands is None else sorted(islands):
+                availability, windows = availabilities.get(island) or self.availability(monster, island)
+                if availability is not None:
+                    rows.append((parent1, parent2, island, availability, windows))
+        return pd.DataFrame(rows, columns=["Parent 1 Species", "Parent 2 Species", "Island", "Availability", "Windows"])
+
+    def candidate_mask(self, df: pd.DataFrame, monsters) -> np.ndarray:
+        """
+        Boolean array, True for the rows of the breeding data whose parents could give
+        any of the monsters on some island, or whose parents aren't in the index at all
+        (those are computed separately by breeder, so can't be ruled out).
+        Every row with one of the monsters in its possible results is a candidate.
+        """
+        codes1, names1 = _derare_codes(df["Parent 1 Species"])
+        codes2, names2 = _derare_codes(df["Parent 2 Species"])
+        # Every distinct pair of parents only gets looked up once
+        pair_codes, pairs = pd.factorize(codes1 * len(names2) + codes2)
+        wanted = self.pairs(monsters)
+        candidate = np.zeros(len(pairs), dtype=bool)
+        for i, pair in enumerate(pairs):
+            parents = (names1[pair // len(names2)], names2[pair % len(names2)])
+            candidate[i] = parents in wanted or parents not in self.parent_pairs
+        return candidate[pair_codes]
+
+    def coverage(self, df: pd.DataFrame, monster: str) -> pd.DataFrame:
+        """
+        The combinations that can produce a monster, with the amount of breeding attempts
+        in df for each of them. Sort by "Attempts" to see what needs more data.
+        """
+        combinations = self.combinations(monster)
+        attempts = pd.DataFrame({
+            "Parent 1 Species": _derare(df["Parent 1 Species"]),
+            "Parent 2 Species": _derare(df["Parent 2 Species"]),
+            "Island": np.asarray(df["Island"], dtype=object),
+        }).value_counts().rename("Attempts").reset_index()
+        combinations = combinations.merge(attempts, how="left", on=["Parent 1 Species", "Parent 2 Species", "Island"])
+        combinations["Attempts"] = combinations["Attempts"].fillna(0).astype(int)
+        return combinations
+
+def _derare_codes(column: pd.Series) -> tuple:
+    # Same as breeder.derare for a whole column, done once per distinct name.
+    # Returns a code per row and the names of the codes, missing names get the last code (None)
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, names = column.cat.codes.to_numpy(), column.cat.categories
+    else:
+        codes, names = pd.factorize(column)
+    common = [name[5:] if name[:5] == "Rare " else name for name in names] + [None]
+    return np.where(codes < 0, len(common) - 1, codes).astype(np.int64), common
+
+def _derare(column: pd.Series) -> np.ndarray:
+    codes, names = _derare_codes(column)
+    return np.array(names, dtype=object)[codes]
@@ -0,0 +1,57 @@
+import pandas as pd
+import filereader
+from vocabulary import build_vocabulary
+# Compact column types for the cleaned breeding data.
+# Monster and island names become categoricals, levels and torches small integers.
+
+MONSTER_COLUMNS = ["Parent 1 Species", "Parent 2 Species", "Result Monster"]
+LEVEL_COLUMNS = ["Parent 1 Level", "Parent 2 Level"]
+TORCH_COLUMN = "Torches Lit"
+ISLAND_COLUMN = "Island"
+COUNT_DTYPE = "Int8" # Nullable, so blank or unreadable levels become <NA>
+
+def monster_dtype(df: pd.DataFrame) -> pd.CategoricalDtype:
+    """
+    One categorical type for all monster columns: every monster in the vocabulary,
+    followed by any other monsters in df (sorted).
+    """
+    monsters = build_vocabulary().monsters
+    known = set(monsters)
+    extra = set()
+    for col in MONSTER_COLUMNS:
+        if col in df.columns:
+            extra.update(value for value in df[col].dropna().unique() if value not in known)
+    return pd.CategoricalDtype(monsters + sorted(extra))
+
+def island_dtype(df: pd.DataFrame) -> pd.CategoricalDtype:
+    """
+    Categorical type for the island column: all islands and their mirrors,
+    followed by any other islands in df (sorted).
+    """
+    islands = list(filereader.rules.always_available)
+    islands = islands + ["M " + island for island in islands]
+    known = set(islands)
+    extra = set()
+    if ISLAND_COLUMN in df.columns:
+        extra.update(value for value in df[ISLAND_COLUMN].dropna().unique() if value not in known)
+    return pd.CategoricalDtype(islands + sorted(extra))
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the columns of cleaned breeding data to their compact types.
+    Missing columns are skipped, so this works on any selection of columns.
+    Applying it to data that already has the schema (e.g. loaded from a snapshot) is cheap.
+    """
+    df = df.copy()
+    monsters = monster_dtype(df)
+    for col in MONSTER_COLUMNS:
+        if col in df.columns and df[col].dtype != monsters:
+            df[col] = df[col].astype(object).astype(monsters)
+    if ISLAND_COLUMN in df.columns:
+        islands = island_dtype(df)
+        if df[ISLAND_COLUMN].dtype != islands:
+            df[ISLAND_COLUMN] = df[ISLAND_COLUMN].astype(object).astype(islands)
+    for col in LEVEL_COLUMNS + [TORCH_COLUMN]:
+        if col in df.columns and df[col].dtype != COUNT_DTYPE:
+            df[col] = pd.to_numeric(df[col], errors="coerce").round().astype(COUNT_DTYPE)
+    return df
@@ -0,0 +1,99 @@
+import contextlib
+import email.utils
+import hashlib
+import http.server
+import threading
+import time
+# Local HTTP stand-in for Google Sheets, to try out fetching without network.
+# Kept out of fetcher.py so reading the sheets doesn't have to import http.server.
+
+class _ServedFiles(dict):
+    # File contents as bytes, remembering when every file was last changed
+    def __init__(self, files: dict):
+        super().__init__()
+        self.modified = {}
+        for path, body in files.items():
+            self[path] = body
+
+    def __setitem__(self, path: str, body) -> None:
+        super().__setitem__(path, body.encode() if isinstance(body, str) else body)
+        self.modified[path] = time.time()
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the server's files with ETag and Last-Modified, answering conditional requests with 304
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if server.failures.get(self.path, 0) > 0:
+            server.failures[self.path] -= 1
+            self.send_error(503)
+            return
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+        time.sleep(server.delay)
+        body = server.files[self.path]
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        last_modified = email.utils.formatdate(server.modified[self.path], usegmt=True)
+        not_modified = (self.headers.get("If-None-Match") == etag if "If-None-Match" in self.headers
+                        else self.headers.get("If-Modified-Since") == last_modified)
+        if not_modified:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def local_server(files: dict, delay: float = 0, failures: dict | None = None):
+    """
+    Local HTTP stand-in for Google Sheets, to try out fetching without network.
+
+    Parameters
+    ----------
+    files: dict
+        Keys are paths (e.g. "/sheet.csv"), values are the contents as bytes or str.
+        Can be changed while the server runs, e.g. to append rows.
+
+    delay: float, default 0
+        Seconds to wait before answering every request, to act like a slow network.
+
+    failures: dict | None, default None
+        Keys are paths, values are how many requests for them fail with 503 first.
+
+    Yields
+    ------
+    server: http.server.ThreadingHTTPServer
+        With attributes url (base url, e.g. "http://127.0.0.1:8000"), files and
+        requests (path and headers of every request).
+
+    Example
+    -------
+    with sheetserver.local_server({"/sheet.csv": sheet, "/validation.csv": validation}) as server:
+        df = filereader.read_data(fetch=fetcher.Fetcher("tmp_cache"), sheet_url=server.url + "/sheet.csv",
+                                  validation_url=server.url + "/validation.csv")
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    server.daemon_threads = True
+    server.files = _ServedFiles(files)
+    server.modified = server.files.modified
+    server.delay = delay
+    server.failures = dict(failures or {})
+    server.requests = []
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,5 +1,11 @@
+import functools
+import itertools
+import numpy as np
 import pandas as pd
+import breeder
 import filereader
+import instrument
+from outcomes import OutcomeMatrix
 # This file will contain functions and routines to gather subsets of the data
 # that can be used in statistical analysis to answer certain
 # specific questions, such as "does it matter if you use a rare or a common?"
@@ -8,10 +14,33 @@ def look_for_outcome(df: pd.DataFrame, monster: str) -> pd.DataFrame:
     """
     Look for all breeding attempts that result in a single, specific monster.
     """
-    mask = []
-    for _, row in df.iterrows():
-        mask.append(monster in row["Possible results"])
-    return df[mask]
+    return look_for_outcome_group(df, [monster])
+
+def outcome_hits(possible_results: pd.Series, monsters) -> tuple:
+    """
+    Find all places where one of the monsters is a possible result, in one pass.
+
+    Parameters
+    ----------
+    possible_results: pd.Series
+        Column of lists of possible results.
+
+    monsters: iterable
+        Monsters to look for.
+
+    Returns
+    -------
+    rows: np.ndarray
+        Row positions (not index labels) of every hit, in increasing order.
+
+    outcomes: np.ndarray
+        The monster that was hit, for every hit.
+    """
+    lengths = np.fromiter((len(results) for results in possible_results), dtype=np.int64, count=len(possible_results))
+    rows = np.repeat(np.arange(len(possible_results)), lengths)
+    outcomes = pd.Series(list(itertools.chain.from_iterable(possible_results)), dtype=object)
+    hit = outcomes.isin(set(monsters)).to_numpy()
+    return rows[hit], outcomes.to_numpy()[hit]
 
 def get_n_elements(full_monster_set: list, amount: int) -> list:
     new_list = []
@@ -21,10 +50,47 @@ def get_n_elements(full_monster_set: list, amount: int) -> list:
                 new_list.append(monster)
     return new_list
 
-def alias_parser(alias: str) -> list:
+@functools.lru_cache(maxsize=None)
+def alias_indexes() -> tuple:
+    """
+    Monster sets used to resolve aliases. Built once, see clear_alias_cache.
+
+    Returns
+    -------
+    full_monster_set: frozenset
+        All monsters in any group.
+
+    group_sets: dict
+        Keys are group names, values are frozensets of monsters.
+
+    count_sets: dict
+        Keys are element counts, values are frozensets of monsters (from any group)
+        with that amount of elements.
+    """
+    group_sets = {name: frozenset(monsters) for name, monsters in zip(filereader.groups["group name"], filereader.groups["monsters"])}
+    full_monster_set = frozenset().union(*group_sets.values())
+    count_sets = {}
+    for monster in full_monster_set:
+        if monster in filereader.elements:
+            count_sets.setdefault(len(filereader.elements[monster]), set()).add(monster)
+    count_sets = {amount: frozenset(monsters) for amount, monsters in count_sets.items()}
+    return full_monster_set, group_sets, count_sets
+
+def clear_alias_cache() -> None:
+    """
+    Forget all resolved aliases, e.g. after changing the groups or elements.
+    """
+    alias_indexes.cache_clear()
+    alias_parser.cache_clear()
+
+filereader.rules.on_reload(clear_alias_cache)
+
+@functools.lru_cache(maxsize=1024)
+def alias_parser(alias: str) -> frozenset:
     """
     Return the group of monsters associated with an alias.
     Aliases can be used for some groups of monsters.
+    Resolved aliases are cached, which is why the group is a frozenset.
     
     Example aliases:
     Common Ethereals
@@ -44,27 +110,23 @@ def alias_parser(alias: str) -> list:
     """
     rarity_indicators = ["Common", "Rare", "Epic"]
     count_indicators = {"singles":1, "doubles":2, "triples":3, "quads":4, "quints":5}
-    group_indicators = list(filereader.groups["group name"])
-    full_monster_set = set()
-    for group in group_indicators:
-        full_monster_set = set.union(full_monster_set, set(filereader.get_group(group)))
+    full_monster_set, group_sets, count_sets = alias_indexes()
     # Do aliases
-    selected_monsters = full_monster_set.copy()
+    selected_monsters = set(full_monster_set)
     # Groups: have a groups file
     
     alias_parts = alias.split(" ")
     # Get group indicator
     if "Expansion" in alias_parts:
-        selected_monsters.intersection_update(filereader.get_group("Fire Expansion"))
+        selected_monsters.intersection_update(group_sets["Fire Expansion"])
     else:
-        for group in group_indicators:
+        for group, group_set in group_sets.items():
             if group in alias_parts:
-                selected_monsters.intersection_update(set(filereader.get_group(group)))
+                selected_monsters.intersection_update(group_set)
     # Do element counts
     for count, amount in count_indicators.items():
         if count in alias_parts:
-            n_elementals = get_n_elements(full_monster_set, amount)
-            selected_monsters.intersection_update(n_elementals)
+            selected_monsters.intersection_update(count_sets.get(amount, frozenset()))
     # Do rarity
     rarity_added = False
     for rarity in rarity_indicators:
@@ -74,10 +136,10 @@ def alias_parser(alias: str) -> list:
             rarity_added = True
     if not rarity_added:
         selected_monsters = selected_monsters.union({"Rare "+monster for monster in selected_monsters}.union({"Epic "+monster for monster in selected_monsters}))
-    monsters = list(selected_monsters)
-    return monsters
+    return frozenset(selected_monsters)
 
-def look_for_outcome_group(df: pd.DataFrame, monsters: list | str) -> pd.DataFrame:
+@instrument.instrumented()
+def look_for_outcome_group(df: pd.DataFrame, monsters: list | str, matched: bool = False, outcomes: OutcomeMatrix | None = None) -> pd.DataFrame:
     """
     Look for a group of monsters in the possible breeding results.
     Aliases can be used for some groups.
@@ -97,16 +159,63 @@ def look_for_outcome_group(df: pd.DataFrame, monsters: list | str) -> pd.DataFra
     Epic Fire Expansion
 
     Note: Fire Expansion Monsters are (currently) not categorized as Fire monsters.
+
+    Every matching row is returned once, in the original order.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Dataframe to look into. Should have a column "Possible results".
+
+    monsters: list | str
+        Monsters to look for. If string, interpreted as a monster group alias.
+
+    matched: bool, default False
+        If True, add a column "Matched targets" with the monsters that were found
+        in the possible results of each row.
+
+    outcomes: OutcomeMatrix | None, default None
+        Possible results as a matrix (see breeder.possible_results_matrix), lined up with df.
+        If given, it's used instead of the "Possible results" column. The matched targets
+        are then in vocabulary order instead of the order of the possible results.
     """
-    
     if type(monsters) is str:
         monsters = alias_parser(monsters)
 
-    result_dfs = []
-    for monster in monsters:
-        result_dfs.append(look_for_outcome(df, monster))
-    return pd.concat(result_dfs)
+    if outcomes is not None:
+        if not outcomes.index.equals(df.index):
+            raise ValueError("Outcome matrix doesn't line up with the dataframe")
+        if not matched:
+            return df[outcomes.mask(monsters)]
+        columns = np.sort(outcomes._columns(monsters))
+        hits = outcomes._aligned()[:, columns].tocsr()
+        hits.sort_indices()
+        selected = np.flatnonzero(np.diff(hits.indptr))
+        names = np.array(outcomes.vocabulary.monsters, dtype=object)[columns]
+        blocks = [names[hits.indices[hits.indptr[row]:hits.indptr[row + 1]]] for row in selected]
+        return _with_matched(df.iloc[selected], blocks)
+
+    # Only rows with fitting parents can have a hit, so only those need to be searched
+    candidates = np.flatnonzero(breeder.reverse_index().candidate_mask(df, monsters))
+    rows, hit_outcomes = outcome_hits(df["Possible results"].iloc[candidates], monsters)
+    rows = candidates[rows]
+    selected = np.unique(rows)
+    subset = df.iloc[selected]
+    if not matched:
+        return subset
+    # rows is sorted, so every selected row has one consecutive block of hits
+    block_starts = np.searchsorted(rows, selected)
+    blocks = np.split(hit_outcomes, block_starts[1:]) if len(selected) > 0 else []
+    return _with_matched(subset, blocks)
 
+def _with_matched(subset: pd.DataFrame, blocks: list) -> pd.DataFrame:
+    # Add the "Matched targets" column, one block of matched monsters per row.
+    # Possible results can list a monster twice (e.g. Scups x Scups), it's only matched once
+    subset = subset.copy()
+    subset["Matched targets"] = pd.Series([list(pd.unique(block)) for block in blocks], index=subset.index, dtype=object)
+    return subset
+
+@instrument.instrumented()
 def constant_torches(df: pd.DataFrame, torch_amount: int | None = None) -> pd.DataFrame:
     """
     Look for all breeding attempts that have a certain amount of torches.
@@ -127,9 +236,47 @@ def constant_torches(df: pd.DataFrame, torch_amount: int | None = None) -> pd.Da
         counts = df["Torches Lit"].value_counts()
         largest_amount = counts.index[0]
         print("Most data found with {} torches: there's {} observations".format(int(largest_amount), counts.iloc[0]))
+        instrument.annotate(torches=int(largest_amount), observations=int(counts.iloc[0]))
         return df[df["Torches Lit"] == largest_amount]
 
-def constant_levels(df: pd.DataFrame, level1: int | None = None, level2: int | None = None) -> pd.DataFrame:
+def level_pair_keys(df: pd.DataFrame, unordered: bool = False) -> np.ndarray:
+    """
+    Pack the parent levels of every row into one integer: level1 * 256 + level2,
+    with -1 for rows where a level is missing.
+    If unordered, the lowest level comes first, so (4, 15) and (15, 4) get the same key.
+    """
+    level1 = pd.to_numeric(df["Parent 1 Level"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    level2 = pd.to_numeric(df["Parent 2 Level"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    missing = np.isnan(level1) | np.isnan(level2) | (level1 < 0) | (level2 < 0) | (level1 > 255) | (level2 > 255)
+    level1 = np.where(missing, 0, level1).astype(np.int64)
+    level2 = np.where(missing, 0, level2).astype(np.int64)
+    if unordered:
+        level1, level2 = np.minimum(level1, level2), np.maximum(level1, level2)
+    return np.where(missing, -1, level1 * 256 + level2)
+
+def level_pair_counts(df: pd.DataFrame, unordered: bool = False) -> pd.DataFrame:
+    """
+    Count the attempts for every combination of parent levels.
+
+    Returns
+    -------
+    counts: pd.DataFrame
+        Columns "Parent 1 Level", "Parent 2 Level" and "Attempts", most attempts first.
+        If unordered, "Parent 1 Level" is the lowest of the two.
+    """
+    keys = level_pair_keys(df, unordered)
+    counts = np.bincount(keys[keys >= 0], minlength=1)
+    present = np.flatnonzero(counts)
+    order = np.argsort(-counts[present], kind="stable") # Ties: lowest levels first
+    present = present[order]
+    return pd.DataFrame({
+        "Parent 1 Level": present // 256,
+        "Parent 2 Level": present % 256,
+        "Attempts": counts[present],
+    })
+
+@instrument.instrumented()
+def constant_levels(df: pd.DataFrame, level1: int | None = None, level2: int | None = None, unordered: bool = False) -> tuple:
     """
     Look for all breeding attempts that have parents of a certain level.
 
@@ -139,8 +286,36 @@ def constant_levels(df: pd.DataFrame, level1: int | None = None, level2: int | N
         Dataframe to look into. Should have columns "Parent 1 Level" and "Parent 2 Level"
 
     level1, level2: int | None, default None
-        The parent levels to look for. If None, finds the combination with the
-        highest amount of datapoints. Currently does not look for combinations
-        where parent 1 is of level level2 and parent 2 is of level level1,
-        but this might change in the future.
-    """
\ No newline at end of file
+        The parent levels to look for. If both are None, finds the combination with the
+        highest amount of datapoints. If only one is None, finds the most common level
+        to go with the other one. The chosen levels are recorded with instrument.annotate.
+
+    unordered: bool, default False
+        If True, also look for combinations where parent 1 is of level level2
+        and parent 2 is of level level1.
+
+    Returns
+    -------
+    subset: pd.DataFrame
+        The attempts with these levels.
+
+    counts: pd.DataFrame
+        Attempts for every combination of levels in df, see level_pair_counts.
+    """
+    keys = level_pair_keys(df, unordered)
+    counts = level_pair_counts(df, unordered)
+    if level1 is not None and level2 is not None:
+        if unordered:
+            level1, level2 = min(level1, level2), max(level1, level2)
+        return df[keys == level1 * 256 + level2], counts
+
+    candidates = counts
+    if level1 is not None:
+        candidates = counts[(counts["Parent 1 Level"] == level1) | (unordered & (counts["Parent 2 Level"] == level1))]
+    elif level2 is not None:
+        candidates = counts[(counts["Parent 2 Level"] == level2) | (unordered & (counts["Parent 1 Level"] == level2))]
+    if candidates.shape[0] == 0:
+        return df.iloc[0:0], counts
+    most = candidates.iloc[0]
+    instrument.annotate(levels=(int(most["Parent 1 Level"]), int(most["Parent 2 Level"])), observations=int(most["Attempts"]))
+    return df[keys == most["Parent 1 Level"] * 256 + most["Parent 2 Level"]], counts
@@ -0,0 +1,80 @@
+import datetime
+import hashlib
+import json
+import os
+import pandas as pd
+# Local snapshots of the cleaned breeding data, so it can be used without fetching
+# the master sheet again (or without network at all).
+
+try:
+    import pyarrow # Only needed for Parquet files: snapshots (otherwise pickle is used) and exports
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+SNAPSHOT_PATH = "msm_snapshot"
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """
+    Hash of the column names and contents of a dataframe.
+    """
+    digest = hashlib.sha256("\x1f".join(str(col) for col in df.columns).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def save_snapshot(df: pd.DataFrame, metadata: dict, path: str = SNAPSHOT_PATH) -> None:
+    """
+    Save a dataframe and its metadata.
+    The data is written to path.parquet (or path.pkl if pyarrow isn't installed),
+    the metadata to path.json.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Cleaned breeding data.
+
+    metadata: dict
+        JSON-serializable information about the data, e.g. source hash and cleaning flags.
+        Fetch time, file format and amount of rows are added automatically.
+
+    path: str, default SNAPSHOT_PATH
+        Path of the snapshot, without extension.
+    """
+    if HAS_PARQUET:
+        df.to_parquet(path + ".parquet", index=False)
+        file_format = "parquet"
+    else:
+        df.to_pickle(path + ".pkl")
+        file_format = "pickle"
+    metadata = dict(metadata)
+    metadata.setdefault("fetched_at", datetime.datetime.now().isoformat(timespec="seconds"))
+    metadata["format"] = file_format
+    metadata["rows"] = df.shape[0]
+    with open(path + ".json", "w") as f:
+        json.dump(metadata, f, indent=2)
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> tuple:
+    """
+    Load a snapshot saved with save_snapshot.
+
+    Returns
+    -------
+    df: pd.DataFrame | None
+        The saved data, or None if there is no (readable) snapshot.
+
+    metadata: dict | None
+        The saved metadata, or None if there is no (readable) snapshot.
+    """
+    if not os.path.exists(path + ".json"):
+        return None, None
+    with open(path + ".json") as f:
+        metadata = json.load(f)
+    if metadata["format"] == "parquet":
+        if not HAS_PARQUET or not os.path.exists(path + ".parquet"):
+            return None, None
+        df = pd.read_parquet(path + ".parquet")
+    else:
+        if not os.path.exists(path + ".pkl"):
+            return None, None
+        df = pd.read_pickle(path + ".pkl")
+    return df, metadata
@@ -0,0 +1,35 @@
+import shutil
+import benchmark
+import breeder
+import filereader
+import resultcache
+from resultcache import ResultCache
+
+def test_cache_forgets_results_when_rules_change(tmp_path):
+    df = benchmark.synthetic_sheet(200, seed=0)
+    cache = ResultCache(path=None)
+    before = breeder.possible_results_batch(df, cache=cache)
+    assert len(cache) > 0
+
+    # Same rules with every event availability removed
+    for file in resultcache.SOURCE_FILES:
+        shutil.copy(filereader.rules.path(file), tmp_path / file)
+    with open(tmp_path / "availabilities.csv") as f:
+        header = f.readline()
+    with open(tmp_path / "availabilities.csv", "w") as f:
+        f.write(header)
+    data_dir = filereader.rules.data_dir
+    try:
+        filereader.rules.reload(str(tmp_path))
+        after = breeder.possible_results_batch(df, cache=cache)
+        assert after == breeder.possible_results_batch(df)
+        assert after != before
+    finally:
+        filereader.rules.reload(data_dir)
+
+def test_cache_kept_when_rules_are_reloaded_unchanged():
+    df = benchmark.synthetic_sheet(50, seed=0)
+    cache = ResultCache(path=None)
+    breeder.possible_results_batch(df, cache=cache)
+    filereader.rules.reload()
+    assert len(cache) > 0
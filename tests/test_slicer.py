@@ -0,0 +1,21 @@
+import pandas as pd
+import benchmark
+import breeder
+import slicer
+
+def test_matched_targets_once_when_possible_results_repeat():
+    # Tapricorn x Tapricorn on Mirror Bone lists Rare Tapricorn twice while it's available
+    df = benchmark.synthetic_sheet(20, seed=0)
+    df["Date (MSM time) (MM/DD/YYYY)"] = pd.Timestamp("2025-09-13")
+    df["Parent 1 Species"] = "Tapricorn"
+    df["Parent 2 Species"] = "Tapricorn"
+    df["Island"] = "M Bone"
+    breeder.add_possible_results_to_df(df)
+    assert df["Possible results"].map(lambda results: results.count("Rare Tapricorn") == 2).all()
+
+    targets = ["Rare Tapricorn", "Rare Theremind"]
+    from_lists = slicer.look_for_outcome_group(df, targets, matched=True)
+    from_matrix = slicer.look_for_outcome_group(df, targets, matched=True, outcomes=breeder.possible_results_matrix(df))
+    assert from_lists.index.equals(from_matrix.index)
+    for listed, matrixed in zip(from_lists["Matched targets"], from_matrix["Matched targets"]):
+        assert sorted(listed) == sorted(matrixed) == targets
@@ -0,0 +1,64 @@
+import numpy as np
+import filereader
+# Integer IDs for monster names, so outcomes can be stored in numeric arrays.
+
+RARITIES = ["Rare", "Epic"]
+
+class MonsterVocabulary:
+    """
+    Two-way mapping between monster names and integer IDs.
+    Monsters that aren't known yet can be added later on, getting the next free ID.
+
+    Parameters
+    ----------
+    monsters: list
+        Monster names, in order of their ID.
+    """
+    def __init__(self, monsters: list):
+        self.monsters = []
+        self.ids = {}
+        for monster in monsters:
+            self.add(monster)
+
+    def add(self, monster: str) -> int:
+        """
+        Get the ID of a monster, adding it to the vocabulary if needed.
+        """
+        monster_id = self.ids.get(monster)
+        if monster_id is None:
+            monster_id = len(self.monsters)
+            self.ids[monster] = monster_id
+            self.monsters.append(monster)
+        return monster_id
+
+    def ids_of(self, monsters) -> np.ndarray:
+        """
+        Get the IDs of several monsters. Unknown monsters are left out.
+        """
+        return np.array([self.ids[monster] for monster in monsters if monster in self.ids], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.monsters)
+
+    def __contains__(self, monster: str) -> bool:
+        return monster in self.ids
+
+    def __getitem__(self, monster_id: int) -> str:
+        return self.monsters[monster_id]
+
+def build_vocabulary() -> MonsterVocabulary:
+    """
+    Build a vocabulary of all monsters in the rule files.
+    All common monsters come first (sorted), followed by the rare and the epic versions
+    in the same order.
+    """
+    common = set(filereader.elements)
+    for monsters in filereader.groups["monsters"]:
+        common.update(monsters)
+    for (parent1, parent2), results in filereader.specials.items():
+        common.update((parent1, parent2))
+        common.update(results)
+    for monsters in filereader.always_available.values():
+        common.update(monsters)
+    common = sorted(common)
+    return MonsterVocabulary(common + [rarity + " " + monster for rarity in RARITIES for monster in common])